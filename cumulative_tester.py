@@ -0,0 +1,104 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+from random import choice, randint, seed
+import shutil
+
+path = './CUMULATIVE'
+shutil.rmtree(path, ignore_errors=True)
+
+db = Database()
+db.open(path)
+
+# creating grades table, its tail records carry every column updated so far
+grades_table = db.create_table('Grades', 5, 0, cumulative=True)
+query = Query(grades_table)
+grades_table.index.create_index(2)
+
+number_of_records = 1000
+number_of_updates = 8000
+seed(3562901)
+# key -> every version of the record, oldest first
+versions = {}
+for key in range(number_of_records):
+    versions[key] = [[key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]]
+    query.insert(*versions[key][0])
+everything = [1, 1, 1, 1, 1]
+
+
+def update(key, columns):
+    # an update changing no column makes no new version
+    if any(value is not None for value in columns):
+        versions[key].append([old if new is None else new for old, new in zip(versions[key][-1], columns)])
+
+
+"""
+# Compares every record's latest and older versions, the indexed column
+# and the sums of the versions with what the updates made of them
+"""
+def check(name):
+    for key, history in versions.items():
+        for relative_version in (0, -1, -2):
+            expected = history[max(len(history) - 1 + relative_version, 0)]
+            result = query.select_version(key, 0, everything, relative_version)
+            if not result or result[0].columns != expected:
+                print('cumulative error:', name, 'key', key, 'version', relative_version, ':',
+                      result[0].columns if result else None, ', correct:', expected)
+        # a projection of some columns only stops at the first tail record too
+        result = query.select(key, 0, [0, 0, 0, 1, 0])
+        if result[0].columns != [None, None, None, history[-1][3], None]:
+            print('cumulative error:', name, 'projection of key', key)
+    for value in range(21):
+        found = sorted(record.key for record in query.select(value, 2, everything))
+        if found != sorted(key for key, history in versions.items() if history[-1][2] == value):
+            print('cumulative error:', name, 'index of column 2, value', value)
+    for relative_version in (0, -1):
+        expected = sum(history[max(len(history) - 1 + relative_version, 0)][1] for history in versions.values())
+        if query.sum_version(0, number_of_records - 1, 1, relative_version) != expected:
+            print('cumulative error:', name, 'sum of version', relative_version)
+
+
+# updates of one column or several at a time, enough for merges to run
+for i in range(number_of_updates):
+    key = randint(0, number_of_records - 1)
+    columns = [None, None, None, None, None]
+    for column in range(1, 5):
+        if randint(0, 2) == 0:
+            columns[column] = randint(0, 20)
+    query.update(key, *columns)
+    update(key, columns)
+check('updated')
+
+# an aborted transaction's updates leave the values carried forward intact
+key = choice(range(number_of_records))
+transaction = Transaction()
+transaction.add_query(query.update, grades_table, key, None, 99, None, None, None)
+transaction.add_query(query.update, grades_table, key, None, None, 99, None, None)
+transaction.add_query(query.select, grades_table, -1, 0, everything)
+transaction.add_query(query.delete, grades_table, -1)
+if transaction.run():
+    print('cumulative error: transaction with a failing query committed')
+transaction = Transaction()
+transaction.add_query(query.update, grades_table, key, None, None, None, 98, None)
+if not transaction.run():
+    print('cumulative error: update after a rollback aborted')
+update(key, [None, None, None, 98, None])
+check('rolled back')
+print("Cumulative finished")
+
+# the table stays cumulative once reopened
+db.close()
+db = Database()
+db.open(path)
+grades_table = db.get_table('Grades')
+query = Query(grades_table)
+if not grades_table.cumulative:
+    print('cumulative error: table not cumulative after reopen')
+for key in range(0, number_of_records, 10):
+    query.update(key, None, None, None, None, key)
+    update(key, [None, None, None, None, key])
+check('reopened')
+db.close()
+shutil.rmtree(path, ignore_errors=True)
+print("Reopen finished")
@@ -0,0 +1,96 @@
+from lstore.bplustree import BPlusTree
+from lstore.db import Database
+from lstore.hash_index import HashIndex
+from lstore.index import BTREE, HASH
+from lstore.query import Query
+
+from random import randint, seed
+import shutil
+
+path = './INDEXES'
+shutil.rmtree(path, ignore_errors=True)
+
+db = Database()
+db.open(path)
+
+# creating grades table
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+grades_table.index.create_index(2, HASH)
+grades_table.index.create_index(3)
+
+number_of_records = 1000
+seed(3562901)
+records = {}
+for key in range(number_of_records):
+    records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+    query.insert(*records[key])
+everything = [1, 1, 1, 1, 1]
+
+
+"""
+# Compares the records found by value on an indexed column with the
+# expected ones, and the sum over a range of values of it
+"""
+def check(name, column):
+    for value in range(21):
+        found = sorted(record.columns for record in query.select(value, column, everything))
+        if found != sorted(columns for columns in records.values() if columns[column] == value):
+            print('index error:', name, 'lookup of', value, 'on column', column)
+    # a range over a hash index is answered by scanning the column
+    scanned = sorted(record.key for record in query.scan(column, 5, 9, everything))
+    if scanned != sorted(key for key, columns in records.items() if 5 <= columns[column] <= 9):
+        print('index error:', name, 'scan of column', column)
+
+
+"""
+# Checks the kind of each index of the table
+"""
+def check_kinds(name, kinds):
+    index = grades_table.index
+    classes = {BTREE: BPlusTree, HASH: HashIndex}
+    for column, kind in kinds.items():
+        if index.kinds[column] != kind or not isinstance(index.indices[column], classes[kind]):
+            print('index error:', name, 'column', column, 'has a', index.kinds[column], 'index, expected', kind)
+
+
+check_kinds('created', {0: BTREE, 2: HASH, 3: BTREE})
+check('created', 2)
+check('created', 3)
+
+# updates and deletes move the entries of both kinds of index
+for key in range(0, number_of_records, 3):
+    columns = [None, None, randint(0, 20), randint(0, 20), None]
+    query.update(key, *columns)
+    records[key] = [old if new is None else new for old, new in zip(records[key], columns)]
+for key in range(1, number_of_records, 7):
+    query.delete(key)
+    del records[key]
+check('updated', 2)
+check('updated', 3)
+
+# an index of another kind replaces the one on the column
+grades_table.index.create_index(3, HASH)
+check_kinds('rebuilt', {3: HASH})
+check('rebuilt', 3)
+print("Index finished")
+
+# the kinds are kept in the catalog and the indices come back as they were
+db.close()
+db = Database()
+db.open(path)
+grades_table = db.get_table('Grades')
+query = Query(grades_table)
+check_kinds('reopened', {0: BTREE, 2: HASH, 3: HASH})
+check('reopened', 2)
+check('reopened', 3)
+# and keep working after the reopen
+for key in range(2, number_of_records, 5):
+    if key in records:
+        query.update(key, None, None, 21, None, None)
+        records[key][2] = 21
+if sorted(record.key for record in query.select(21, 2, everything)) != sorted(key for key in records if records[key][2] == 21):
+    print('index error: lookup after reopen and update')
+db.close()
+shutil.rmtree(path, ignore_errors=True)
+print("Reopen finished")
@@ -0,0 +1,100 @@
+from lstore.db import Database
+from lstore.page_range import RECORDS_PER_RANGE
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+from random import randint, seed
+import os
+import shutil
+
+path = './INSERT_MANY'
+shutil.rmtree(path, ignore_errors=True)
+
+seed(3562901)
+# a batch filling more than a page range, after a few single inserts so it
+# starts in the middle of a page
+singles = {key: [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)] for key in range(100)}
+batch = {key: [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+         for key in range(100, 100 + RECORDS_PER_RANGE + 1000)}
+records = dict(singles)
+records.update(batch)
+everything = [1, 1, 1, 1, 1]
+
+
+"""
+# Compares the table with records: every key, the indexed column and a sum
+"""
+def check(name):
+    for key in list(records) + [-1, 100 + len(batch)]:
+        result = query.select(key, 0, everything)
+        if (result[0].columns if result else None) != records.get(key):
+            print('insert_many error:', name, 'key', key, ':', result[0].columns if result else None, ', correct:', records.get(key))
+    for value in range(21):
+        found = sorted(record.key for record in query.select(value, 2, everything))
+        if found != sorted(key for key, columns in records.items() if columns[2] == value):
+            print('insert_many error:', name, 'index of column 2, value', value)
+    if query.sum(min(records), max(records), 1) != sum(columns[1] for columns in records.values()):
+        print('insert_many error:', name, 'sum')
+
+
+db = Database()
+db.open(path)
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+grades_table.index.create_index(2)
+for columns in singles.values():
+    query.insert(*columns)
+if not query.insert_many(batch.values()):
+    print('insert_many error: batch rejected')
+check('batch')
+
+# a batch is inserted whole or not at all
+rejected = [[-1, 0, 0, 0, 0], [5, 0, 0, 0, 0]]
+if query.insert_many(rejected):
+    print('insert_many error: batch with an existing key accepted')
+if query.insert_many([[-1, 0, 0, 0, 0], [-1, 1, 1, 1, 1]]):
+    print('insert_many error: batch repeating a key accepted')
+if query.insert_many([[-1, 0, 0, 0, 0], [-2, 0, 0, 0]]):
+    print('insert_many error: batch with a short row accepted')
+# and rolled back whole with its transaction
+transaction = Transaction()
+transaction.add_query(query.insert_many, grades_table, [[-1 - i, 0, 0, 0, 0] for i in range(1000)])
+transaction.add_query(query.update, grades_table, -1, None, None, None, None, 1)
+transaction.add_query(query.select, grades_table, -5000, 0, everything)
+transaction.add_query(query.delete, grades_table, -5000)
+if transaction.run():
+    print('insert_many error: transaction with a failing query committed')
+check('rejected')
+print("Insert many finished")
+
+# the batch survives a clean reopen
+db.close()
+db = Database()
+db.open(path)
+grades_table = db.get_table('Grades')
+query = Query(grades_table)
+check('reopened')
+db.close()
+
+# and a crash: a batch committed before it is recovered from the log
+crashed = {key: [key, 1, 2, 3, 4] for key in range(-2000, 0)}
+pid = os.fork()
+if pid == 0:
+    db = Database()
+    db.open(path)
+    grades_table = db.get_table('Grades')
+    query = Query(grades_table)
+    transaction = Transaction()
+    transaction.add_query(query.insert_many, grades_table, crashed.values())
+    transaction.run()
+    os._exit(0)
+os.waitpid(pid, 0)
+records.update(crashed)
+db = Database()
+db.open(path)
+grades_table = db.get_table('Grades')
+query = Query(grades_table)
+check('recovered')
+db.close()
+shutil.rmtree(path, ignore_errors=True)
+print("Reopen finished")
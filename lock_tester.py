@@ -0,0 +1,105 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+from threading import Event, Thread
+
+db = Database()
+
+# creating grades table
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+grades_table.index.create_index(2)
+
+number_of_records = 100
+for key in range(number_of_records):
+    query.insert(key, key, key, key, key)
+
+
+"""
+# Runs a transaction of the holder's queries on a thread and stops it after
+# them, then runs a transaction of the other queries while the holder keeps
+# its locks. The holder commits, or aborts if abort is set, afterwards.
+# Returns whether the other transaction committed
+"""
+def run_against(holder_queries, other_queries, abort=False):
+    reached, resume = Event(), Event()
+    def pause():
+        reached.set()
+        resume.wait()
+        return not abort
+    holder = Transaction()
+    for query_function, *args in holder_queries:
+        holder.add_query(query_function, grades_table, *args)
+    holder.add_query(pause, grades_table)
+    results = []
+    thread = Thread(target=lambda: results.append(holder.run()))
+    thread.start()
+    reached.wait()
+    other = Transaction()
+    for query_function, *args in other_queries:
+        other.add_query(query_function, grades_table, *args)
+    # queries that only read would take a snapshot instead of locks
+    other.add_query(query.update, grades_table, number_of_records - 1, None, None, None, None, 0)
+    committed = other.run()
+    resume.set()
+    thread.join()
+    if results != [not abort]:
+        print('lock error: holding transaction did not', 'abort' if abort else 'commit')
+    return committed
+
+
+def expect(name, committed, expected):
+    if committed != expected:
+        print('lock error:', name, 'committed' if committed else 'aborted')
+
+
+everything = [1, 1, 1, 1, 1]
+
+# shared locks are compatible with each other, not with exclusive ones
+expect('select next to select', run_against([(query.select, 1, 0, everything)], [(query.select, 1, 0, everything)]), True)
+expect('update next to select', run_against([(query.select, 1, 0, everything)], [(query.update, 1, None, 7, None, None, None)]), False)
+expect('select next to update', run_against([(query.update, 2, None, 7, None, None, None)], [(query.select, 2, 0, everything)]), False)
+expect('update next to update', run_against([(query.update, 2, None, 8, None, None, None)], [(query.update, 2, None, 9, None, None, None)]), False)
+expect('sum next to update', run_against([(query.update, 2, None, 10, None, None, None)], [(query.sum, 0, 10, 1)]), False)
+expect('update in a summed range', run_against([(query.sum, 0, 10, 1)], [(query.update, 3, None, 7, None, None, None)]), False)
+expect('scan next to update', run_against([(query.update, 4, None, 7, None, None, None)], [(query.scan, 2, 0, 10, everything)]), False)
+# records of other keys are not locked
+expect('update next to update of another key', run_against([(query.update, 5, None, 7, None, None, None)], [(query.update, 6, None, 7, None, None, None)]), True)
+# a transaction can upgrade its own shared lock
+expect('select then update', run_against([], [(query.select, 7, 0, everything), (query.update, 7, None, 7, None, None, None)]), True)
+
+# readers of a value that a running transaction deletes or changes meet its lock
+expect('select of a deleted key', run_against([(query.delete, 10)], [(query.select, 10, 0, everything)], abort=True), False)
+expect('insert of a deleted key', run_against([(query.delete, 10)], [(query.insert, 10, 0, 0, 0, 0)], abort=True), False)
+expect('select of a changed key', run_against([(query.update, 11, 1011, None, None, None, None)], [(query.select, 11, 0, everything)], abort=True), False)
+expect('select of a new key', run_against([(query.update, 11, 1011, None, None, None, None)], [(query.select, 1011, 0, everything)], abort=True), False)
+expect('select of a changed value', run_against([(query.update, 12, None, None, 1012, None, None)], [(query.select, 12, 2, everything)], abort=True), False)
+expect('select_many of a deleted key', run_against([(query.delete, 13)], [(query.select_many, [12, 13], 0, everything)], abort=True), False)
+expect('sum over a deleted key', run_against([(query.delete, 14)], [(query.sum, 14, 14, 1)], abort=True), False)
+
+# the locks go with the transaction, committed or aborted
+for key in (1, 2, 3, 4, 10, 11, 12, 13, 14):
+    transaction = Transaction()
+    transaction.add_query(query.update, grades_table, key, None, None, None, None, 1)
+    if not transaction.run():
+        print('lock error: record', key, 'still locked')
+for key in (10, 11, 12, 13, 14):
+    if query.select(key, 0, everything)[0].columns != [key, key, key, key, 1]:
+        print('lock error: aborted change to', key, 'left behind')
+
+# a query that raises aborts its transaction, which rolls back and unlocks
+crashing = Transaction()
+crashing.add_query(query.update, grades_table, 20, None, 7, None, None, None)
+crashing.add_query(query.select, grades_table, 20, 7, everything)
+if crashing.run():
+    print('lock error: transaction with a crashing query committed')
+if query.select(20, 0, everything)[0].columns != [20, 20, 20, 20, 20]:
+    print('lock error: change of a crashed transaction left behind')
+transaction = Transaction()
+transaction.add_query(query.update, grades_table, 20, None, None, None, None, 1)
+if not transaction.run():
+    print('lock error: record of a crashed transaction still locked')
+print("Locks finished")
+
+db.close()
@@ -0,0 +1,237 @@
+from bisect import bisect_left, bisect_right
+
+# maximum number of keys held by one node before it splits
+ORDER = 64
+
+
+class Leaf:
+
+    def __init__(self):
+        self.keys = []
+        # values[i] is the list of RIDs stored under keys[i]
+        self.values = []
+        self.next = None
+
+
+class Node:
+
+    def __init__(self, keys, children):
+        self.keys = keys
+        self.children = children
+
+
+class BPlusTree:
+
+    """
+    # In-memory B+-tree mapping a column value to the RIDs holding it.
+    # Duplicate values share one key whose value is a list of RIDs, and the
+    # leaves are linked left to right so range scans never revisit the root.
+    # Deletes are lazy: emptied keys are dropped from their leaf but nodes are
+    # not merged, which keeps separators valid and is cheap for our workloads.
+    """
+    def __init__(self, order=ORDER):
+        self.order = order
+        self.root = Leaf()
+        self.num_keys = 0
+
+    """
+    # Builds a tree bottom-up from (key, rids) pairs already sorted by key.
+    # Leaves are packed to three quarters full, leaving room for later inserts.
+    """
+    @classmethod
+    def bulk_load(cls, items, order=ORDER):
+        tree = cls(order)
+        fill = max(2, order * 3 // 4)
+        # (smallest key, node) for every node of the level being built
+        level = []
+        leaf = None
+        for key, rids in items:
+            if leaf is None or len(leaf.keys) == fill:
+                previous, leaf = leaf, Leaf()
+                if previous is not None:
+                    previous.next = leaf
+                level.append((key, leaf))
+            leaf.keys.append(key)
+            leaf.values.append(rids)
+            tree.num_keys += 1
+        while len(level) > 1:
+            groups = [level[i:i + fill + 1] for i in range(0, len(level), fill + 1)]
+            # never leave a parent with a single child
+            if len(groups) > 1 and len(groups[-1]) == 1:
+                groups[-2].extend(groups.pop())
+            level = [(group[0][0], Node([key for key, _ in group[1:]], [node for _, node in group])) for group in groups]
+        if level:
+            tree.root = level[0][1]
+        return tree
+
+    def __len__(self):
+        return self.num_keys
+
+    def __find_leaf(self, key):
+        node = self.root
+        while isinstance(node, Node):
+            node = node.children[bisect_right(node.keys, key)]
+        return node
+
+    """
+    # Returns the list of RIDs stored under key (empty if absent)
+    """
+    def get(self, key):
+        leaf = self.__find_leaf(key)
+        i = bisect_left(leaf.keys, key)
+        if i < len(leaf.keys) and leaf.keys[i] == key:
+            return leaf.values[i]
+        return []
+
+    """
+    # Returns {key: rids} for the keys present among the given ones. The keys
+    # are looked up in ascending order, moving on to the next leaf where
+    # possible, so a batch of close keys costs one descent from the root.
+    """
+    def get_many(self, keys):
+        found = {}
+        leaf = None
+        for key in sorted(set(keys)):
+            if leaf is None or not leaf.keys or key > leaf.keys[-1]:
+                following = None if leaf is None else leaf.next
+                if following is not None and following.keys and key <= following.keys[-1]:
+                    leaf = following
+                else:
+                    leaf = self.__find_leaf(key)
+            i = bisect_left(leaf.keys, key)
+            if i < len(leaf.keys) and leaf.keys[i] == key:
+                found[key] = leaf.values[i]
+        return found
+
+    """
+    # Adds rid under key, keeping any RIDs already stored there
+    """
+    def insert(self, key, rid):
+        split = self.__insert(self.root, key, rid)
+        if split is not None:
+            separator, right = split
+            self.root = Node([separator], [self.root, right])
+
+    def __insert(self, node, key, rid):
+        if isinstance(node, Leaf):
+            i = bisect_left(node.keys, key)
+            if i < len(node.keys) and node.keys[i] == key:
+                node.values[i].append(rid)
+                return None
+            node.keys.insert(i, key)
+            node.values.insert(i, [rid])
+            self.num_keys += 1
+            if len(node.keys) > self.order:
+                return self.__split_leaf(node)
+            return None
+        i = bisect_right(node.keys, key)
+        split = self.__insert(node.children[i], key, rid)
+        if split is None:
+            return None
+        separator, right = split
+        node.keys.insert(i, separator)
+        node.children.insert(i + 1, right)
+        if len(node.keys) > self.order:
+            return self.__split_node(node)
+        return None
+
+    def __split_leaf(self, leaf):
+        middle = len(leaf.keys) // 2
+        right = Leaf()
+        right.keys = leaf.keys[middle:]
+        right.values = leaf.values[middle:]
+        del leaf.keys[middle:]
+        del leaf.values[middle:]
+        right.next = leaf.next
+        leaf.next = right
+        return right.keys[0], right
+
+    def __split_node(self, node):
+        middle = len(node.keys) // 2
+        separator = node.keys[middle]
+        right = Node(node.keys[middle + 1:], node.children[middle + 1:])
+        del node.keys[middle:]
+        del node.children[middle + 1:]
+        return separator, right
+
+    """
+    # Removes rid from under key
+    # Returns True if it was present
+    """
+    def remove(self, key, rid):
+        leaf = self.__find_leaf(key)
+        i = bisect_left(leaf.keys, key)
+        if i == len(leaf.keys) or leaf.keys[i] != key:
+            return False
+        rids = leaf.values[i]
+        if rid not in rids:
+            return False
+        rids.remove(rid)
+        if not rids:
+            del leaf.keys[i]
+            del leaf.values[i]
+            self.num_keys -= 1
+        return True
+
+    """
+    # Moves rid from under old_key to under new_key. A new key that falls in
+    # the leaf holding the old one is added there without a second descent
+    # from the root, unless the leaf would have to split.
+    """
+    def move(self, old_key, new_key, rid):
+        leaf = self.__find_leaf(old_key)
+        keys = leaf.keys
+        # keys between the first and last key of a leaf can only live in that leaf
+        same_leaf = keys and keys[0] <= new_key <= keys[-1]
+        i = bisect_left(keys, old_key)
+        if i < len(keys) and keys[i] == old_key and rid in leaf.values[i]:
+            rids = leaf.values[i]
+            rids.remove(rid)
+            if not rids:
+                del keys[i]
+                del leaf.values[i]
+                self.num_keys -= 1
+        if same_leaf:
+            i = bisect_left(keys, new_key)
+            if i < len(keys) and keys[i] == new_key:
+                leaf.values[i].append(rid)
+                return
+            if len(keys) < self.order:
+                keys.insert(i, new_key)
+                leaf.values.insert(i, [rid])
+                self.num_keys += 1
+                return
+        self.insert(new_key, rid)
+
+    """
+    # Yields (key, rids) for every key in [begin, end] in ascending order
+    """
+    def range(self, begin, end):
+        leaf = self.__find_leaf(begin)
+        i = bisect_left(leaf.keys, begin)
+        while leaf is not None:
+            keys = leaf.keys
+            while i < len(keys):
+                if keys[i] > end:
+                    return
+                yield keys[i], leaf.values[i]
+                i += 1
+            leaf = leaf.next
+            i = 0
+
+    """
+    # Yields (key, rids) for every key in ascending order, from begin on if given
+    """
+    def items(self, begin=None):
+        if begin is not None:
+            leaf = self.__find_leaf(begin)
+            i = bisect_left(leaf.keys, begin)
+            yield from zip(leaf.keys[i:], leaf.values[i:])
+            node = leaf.next
+        else:
+            node = self.root
+            while isinstance(node, Node):
+                node = node.children[0]
+        while node is not None:
+            yield from zip(node.keys, node.values)
+            node = node.next
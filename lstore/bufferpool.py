@@ -0,0 +1,238 @@
+import mmap
+import os
+import shutil
+from collections import OrderedDict
+from threading import Lock
+from weakref import WeakValueDictionary
+
+from lstore.page import Page, PAGE_SIZE
+
+# number of page frames the buffer pool may hold (4096 bytes each)
+BUFFER_POOL_SIZE = 2048
+# page files are mapped a segment at a time; 64 KiB keeps every mapping
+# offset aligned to mmap.ALLOCATIONGRANULARITY on all platforms
+SEGMENT_PAGES = 16
+SEGMENT_SIZE = SEGMENT_PAGES * PAGE_SIZE
+
+
+class Frame:
+
+    def __init__(self, page):
+        self.page = page
+        self.pin_count = 0
+        self.dirty = False
+        # LSN of the page when it was last dirtied after a write-back, the
+        # oldest change of the page that may be missing on disk
+        self.rec_lsn = 0
+        # set when the page was dropped while still pinned
+        self.discarded = False
+
+
+class BufferPool:
+
+    """
+    # Caches pages in a fixed number of frames. A page is identified by
+    # (file, page_index) where file is a path relative to the database
+    # directory and page_index its position in that file. Pinned frames are
+    # never evicted; unpinned frames are evicted least recently used first and
+    # written back if dirty. Without a path the pool is purely in memory and
+    # never evicts.
+    # Page files are memory-mapped read-only, so a resident page is a
+    # zero-copy view over the mapping until it is first written, when it
+    # takes a private copy (see Page). Changes only reach the file when the
+    # page is written back, and the memory of a written page goes with its
+    # frame. Write-back follows the write-ahead rule: the log is flushed up
+    # to the page LSN before the page is written.
+    :param path: string         #Database directory, None for an in-memory pool
+    :param capacity: int        #Maximum number of frames
+    """
+    def __init__(self, path=None, capacity=BUFFER_POOL_SIZE):
+        self.path = path
+        self.capacity = capacity
+        # page_id -> Frame, least recently used first
+        self.frames = OrderedDict()
+        # (file, segment) -> mmap, alive as long as a resident page views it
+        self.segments = WeakValueDictionary()
+        # files written since their last fsync
+        self.unsynced = set()
+        # write-ahead log the page LSNs refer to, set by the database
+        self.log = None
+        self.lock = Lock()
+
+    """
+    # Returns the page with the given id, loading it if it is not resident.
+    # num_records is the number of slots in use, needed when the page is read
+    # from disk. Every pin must be paired with an unpin.
+    """
+    def pin(self, page_id, num_records=0):
+        while True:
+            with self.lock:
+                frame = self.frames.get(page_id)
+                if frame is not None:
+                    self.frames.move_to_end(page_id)
+                    frame.pin_count += 1
+                    return frame.page
+                lsn = None
+                if self.path is not None and len(self.frames) >= self.capacity:
+                    lsn = self.__evict()
+                if lsn is None:
+                    frame = Frame(self.__load(page_id, num_records))
+                    self.frames[page_id] = frame
+                    frame.pin_count += 1
+                    return frame.page
+            # force the log outside the pool lock, then look again
+            self.log.flush(lsn)
+
+    """
+    # Releases one pin on a page, marking it dirty if it was written to.
+    # rec_lsn is the oldest logged change the write may have added, for a
+    # write of changes logged before the page LSN (the page LSN by default)
+    """
+    def unpin(self, page_id, dirty=False, rec_lsn=None):
+        with self.lock:
+            frame = self.frames[page_id]
+            frame.pin_count -= 1
+            if dirty and not frame.dirty:
+                frame.dirty = True
+                frame.rec_lsn = frame.page.lsn
+            if dirty and rec_lsn is not None and rec_lsn < frame.rec_lsn:
+                frame.rec_lsn = rec_lsn
+            if frame.discarded and frame.pin_count == 0:
+                del self.frames[page_id]
+
+    """
+    # Drops the pages of a file from the pool without writing them back and
+    # deletes the file
+    # Returns True if the file existed on disk
+    """
+    def discard(self, file):
+        with self.lock:
+            self.__drop_frames(lambda page_file: page_file == file)
+            self.unsynced.discard(file)
+            if self.path is not None and os.path.exists(self.__file_path(file)):
+                os.remove(self.__file_path(file))
+                return True
+        return False
+
+    """
+    # Drops the pages of every file under a directory and deletes the directory
+    """
+    def drop(self, directory):
+        prefix = directory + os.sep
+        with self.lock:
+            self.__drop_frames(lambda page_file: page_file.startswith(prefix))
+            self.unsynced = {file for file in self.unsynced if not file.startswith(prefix)}
+            if self.path is not None:
+                shutil.rmtree(self.__file_path(directory), ignore_errors=True)
+
+    def __drop_frames(self, matches):
+        for page_id in [page_id for page_id in self.frames if matches(page_id[0])]:
+            frame = self.frames[page_id]
+            if frame.pin_count == 0:
+                del self.frames[page_id]
+            else:
+                frame.discarded = True
+
+    """
+    # Writes every dirty unpinned page back to disk and fsyncs the page files.
+    # Pinned pages are left for the next flush, so writers are never blocked.
+    """
+    def flush_all(self):
+        self.__flush(lambda page_file: True)
+
+    """
+    # Writes the dirty pages of one file back to disk and fsyncs it
+    """
+    def flush_file(self, file):
+        self.__flush(lambda page_file: page_file == file)
+
+    """
+    # Returns {page_id: rec_lsn} of every dirty page (the dirty page table)
+    """
+    def dirty_pages(self):
+        with self.lock:
+            return {page_id: frame.rec_lsn for page_id, frame in self.frames.items() if frame.dirty and not frame.discarded}
+
+    def __flush(self, matches):
+        if self.path is None:
+            return
+        with self.lock:
+            page_ids = [page_id for page_id, frame in self.frames.items() if frame.dirty and matches(page_id[0])]
+        for page_id in page_ids:
+            while True:
+                with self.lock:
+                    frame = self.frames.get(page_id)
+                    if frame is None or not frame.dirty or frame.discarded or frame.pin_count:
+                        break
+                    lsn = frame.page.lsn
+                    if self.log is None or self.log.durable_lsn > lsn:
+                        self.__write(page_id, frame.page)
+                        frame.dirty = False
+                        break
+                # force the log outside the pool lock, then look again
+                self.log.flush(lsn)
+        self.sync()
+
+    """
+    # fsyncs every page file written since the last sync
+    """
+    def sync(self):
+        with self.lock:
+            files, self.unsynced = self.unsynced, set()
+        for file in files:
+            try:
+                fd = os.open(self.__file_path(file), os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    # evicts the least recently used unpinned page; returns None if it did,
+    # or the LSN the log must be forced to before a dirty victim is written
+    def __evict(self):
+        for page_id, frame in self.frames.items():
+            if frame.pin_count == 0:
+                if frame.dirty and not frame.discarded:
+                    if self.log is not None and self.log.durable_lsn <= frame.page.lsn:
+                        return frame.page.lsn
+                    self.__write(page_id, frame.page)
+                del self.frames[page_id]
+                return None
+        raise RuntimeError("buffer pool exhausted: all %d frames are pinned" % self.capacity)
+
+    def __file_path(self, file):
+        return os.path.join(self.path, file)
+
+    def __load(self, page_id, num_records):
+        if self.path is None:
+            return Page(None, num_records)
+        file, page_index = page_id
+        segment, index = divmod(page_index, SEGMENT_PAGES)
+        mapping = self.segments.get((file, segment))
+        if mapping is None:
+            mapping = self.__map(file, segment)
+            self.segments[(file, segment)] = mapping
+        return Page(memoryview(mapping)[index * PAGE_SIZE:(index + 1) * PAGE_SIZE], num_records)
+
+    def __map(self, file, segment):
+        file_path = self.__file_path(file)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'r+b' if os.path.exists(file_path) else 'w+b') as f:
+            end = (segment + 1) * SEGMENT_SIZE
+            if os.fstat(f.fileno()).st_size < end:
+                # grows the file sparsely, unwritten pages read as zeros
+                f.truncate(end)
+            return mmap.mmap(f.fileno(), SEGMENT_SIZE, access=mmap.ACCESS_READ, offset=segment * SEGMENT_SIZE)
+
+    def __write(self, page_id, page):
+        if self.path is None:
+            return
+        file, page_index = page_id
+        fd = os.open(self.__file_path(file), os.O_WRONLY)
+        try:
+            os.pwrite(fd, page.data, page_index * PAGE_SIZE)
+        finally:
+            os.close(fd)
+        self.unsynced.add(file)
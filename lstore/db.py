@@ -1,26 +1,153 @@
-from lstore.table import Table
+import json
+import os
+import pickle
+from threading import Event, Lock, Thread
+
+from lstore.bufferpool import BufferPool
+from lstore.log import Log, GROUP, AUTOCOMMIT, repair_log
+from lstore.recovery import recover
+from lstore.table import Table, MAX_COLUMNS
+from lstore.transaction import next_txn_id, skip_txn_ids
+
+# table metadata and page directories, one file per database
+CATALOG_FILE = 'catalog.json'
+# index snapshot of a table, stored in the table's directory
+INDEX_FILE = 'indices.pickle'
+# a checkpoint is taken whenever the log has grown this much since the last one
+CHECKPOINT_LOG_SIZE = 16 * 1024 * 1024
+# how often the checkpoint thread looks at the log size, in seconds
+CHECKPOINT_INTERVAL = 1.0
 
 class Database():
 
     def __init__(self):
         self.tables = []
-        pass
+        # in memory until open() gives the database a directory
+        self.path = None
+        self.bufferpool = BufferPool()
+        self.log = None
+        self.checkpoint_lock = Lock()
+        self.checkpoint_size = 0
+        self.closing = Event()
 
-    # Not required for milestone1
-    def open(self, path):
-        pass
+    """
+    # Stores the database under path, creating it if needed. The tables are
+    # restored from the last checkpoint's catalog and index snapshots, then
+    # the write-ahead log is replayed over them (see lstore.recovery), so
+    # changes committed after the checkpoint survive a crash.
+    :param durability: string   #How commits reach the write-ahead log, see lstore.log
+    """
+    def open(self, path, durability=GROUP):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.bufferpool = BufferPool(path)
+        self.tables = []
+        catalog = {'tables': [], 'checkpoint': None, 'next_txn_id': 1}
+        catalog_path = os.path.join(path, CATALOG_FILE)
+        if os.path.exists(catalog_path):
+            with open(catalog_path) as f:
+                catalog = json.load(f)
+        repair_log(path)
+        self.log = Log(path, durability)
+        self.bufferpool.log = self.log
+        for metadata in catalog['tables']:
+            table = Table(metadata['name'], metadata['num_columns'], metadata['key'], self.bufferpool, self.log,
+                          metadata['cumulative'])
+            table.restore(metadata)
+            with open(os.path.join(path, table.name, INDEX_FILE), 'rb') as f:
+                table.index.restore(pickle.load(f), metadata['indices'])
+            self.tables.append(table)
+        max_txn_id = recover(self, catalog['checkpoint'])
+        skip_txn_ids(max(catalog['next_txn_id'], max_txn_id + 1))
+        self.checkpoint()
+        self.closing.clear()
+        Thread(target=self.__checkpoint_periodically, daemon=True).start()
 
+    """
+    # Finishes pending merges and takes a final checkpoint, so the next open
+    # has no log to replay
+    """
     def close(self):
-        pass
+        for table in self.tables:
+            table.wait_for_merges()
+        if self.path is None:
+            return
+        self.closing.set()
+        self.checkpoint()
+        self.log.close()
+
+    """
+    # Takes a fuzzy checkpoint: queries keep running while it writes the
+    # dirty pages back, then the log records which transactions were running
+    # and which pages were still dirty, and the catalog and index snapshots
+    # are saved. Recovery starts from the last checkpoint, so the more often
+    # one is taken the less log there is to replay.
+    """
+    def checkpoint(self):
+        if self.path is None:
+            return
+        with self.checkpoint_lock:
+            self.bufferpool.flush_all()
+            begin = self.log.append(AUTOCOMMIT, 'begin_checkpoint')
+            tables = list(self.tables)
+            # changes logged before begin have reached their pages and indices
+            for table in tables:
+                table.quiesce()
+            state = {'att': self.log.active_transactions(), 'dpt': self.bufferpool.dirty_pages()}
+            metadata = [table.metadata() for table in tables]
+            snapshots = [table.index.snapshot() for table in tables]
+            retired = [[(page_range, len(page_range.retired)) for page_range in table.page_directory.ranges]
+                       for table in tables]
+            end = self.log.append(AUTOCOMMIT, 'end_checkpoint', state)
+            self.log.flush(end)
+            for table, snapshot in zip(tables, snapshots):
+                os.makedirs(os.path.join(self.path, table.name), exist_ok=True)
+                self.__write_file(os.path.join(table.name, INDEX_FILE), pickle.dumps(snapshot))
+            catalog = {
+                'tables': metadata,
+                'checkpoint': {'begin': begin, 'end': end},
+                'next_txn_id': next_txn_id(),
+            }
+            self.__write_file(CATALOG_FILE, json.dumps(catalog).encode())
+            self.checkpoint_size = self.log.size()
+            # base files replaced by merges before the checkpoint are no longer referenced
+            for ranges in retired:
+                for page_range, count in ranges:
+                    with page_range.lock:
+                        page_range.release_retired(count)
+
+    def __checkpoint_periodically(self):
+        while not self.closing.wait(CHECKPOINT_INTERVAL):
+            if self.log.size() - self.checkpoint_size >= CHECKPOINT_LOG_SIZE:
+                self.checkpoint()
+
+    # writes through a temporary file so a crash never leaves a torn file behind
+    def __write_file(self, name, data):
+        file_path = os.path.join(self.path, name)
+        with open(file_path + '.tmp', 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(file_path + '.tmp', file_path)
 
     """
     # Creates a new table
     :param name: string         #Table name
-    :param num_columns: int     #Number of Columns: all columns are integer
+    :param num_columns: int     #Number of Columns: all columns are integer, at most MAX_COLUMNS
     :param key: int             #Index of table key in columns
+    :param cumulative: bool     #Whether tail records carry every column updated so far, bounding
+                                #latest-version reads to one tail record at the cost of wider tail records
     """
-    def create_table(self, name, num_columns, key_index):
-        table = Table(name, num_columns, key_index)
+    def create_table(self, name, num_columns, key_index, cumulative=False):
+        # rejected before a table of the same name is dropped for it
+        if not 0 < num_columns <= MAX_COLUMNS:
+            raise ValueError("a table has 1 to %d columns, got %d" % (MAX_COLUMNS, num_columns))
+        # a new table replaces any table of the same name
+        self.drop_table(name)
+        table = Table(name, num_columns, key_index, self.bufferpool, self.log, cumulative)
+        self.tables.append(table)
+        # the catalog must know the table before recovery can replay its log
+        self.checkpoint()
         return table
 
     
@@ -28,11 +155,20 @@ class Database():
     # Deletes the specified table
     """
     def drop_table(self, name):
-        pass
+        table = self.get_table(name)
+        if table is not None:
+            table.wait_for_merges()
+            self.tables.remove(table)
+            # the catalog must forget the table before its files go
+            self.checkpoint()
+        self.bufferpool.drop(name)
 
     
     """
     # Returns table with the passed name
     """
     def get_table(self, name):
-        pass
+        for table in self.tables:
+            if table.name == name:
+                return table
+        return None
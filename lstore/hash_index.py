@@ -0,0 +1,71 @@
+class HashIndex:
+
+    """
+    # Hash index mapping a column value to the RIDs holding it, with the same
+    # interface as BPlusTree minus ordered access. A lookup is one dict probe
+    # instead of a descent from the root, but ranges over the column can only
+    # be answered by scanning it.
+    """
+    def __init__(self):
+        self.buckets = {}
+
+    """
+    # Builds an index from (key, rids) pairs in any order
+    """
+    @classmethod
+    def bulk_load(cls, items):
+        index = cls()
+        index.buckets = dict(items)
+        return index
+
+    def __len__(self):
+        return len(self.buckets)
+
+    """
+    # Returns the list of RIDs stored under key (empty if absent)
+    """
+    def get(self, key):
+        return self.buckets.get(key, [])
+
+    """
+    # Returns {key: rids} for the keys present among the given ones
+    """
+    def get_many(self, keys):
+        buckets = self.buckets
+        return {key: buckets[key] for key in keys if key in buckets}
+
+    """
+    # Adds rid under key, keeping any RIDs already stored there
+    """
+    def insert(self, key, rid):
+        rids = self.buckets.get(key)
+        if rids is None:
+            self.buckets[key] = [rid]
+        else:
+            rids.append(rid)
+
+    """
+    # Removes rid from under key
+    # Returns True if it was present
+    """
+    def remove(self, key, rid):
+        rids = self.buckets.get(key)
+        if rids is None or rid not in rids:
+            return False
+        rids.remove(rid)
+        if not rids:
+            del self.buckets[key]
+        return True
+
+    """
+    # Moves rid from under old_key to under new_key
+    """
+    def move(self, old_key, new_key, rid):
+        self.remove(old_key, rid)
+        self.insert(new_key, rid)
+
+    """
+    # Yields (key, rids) for every key, in no particular order
+    """
+    def items(self):
+        return iter(self.buckets.items())
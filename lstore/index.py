@@ -1,38 +1,360 @@
 """
 A data strucutre holding indices for various columns of a table. Key column should be indexd by default, other columns can be indexed through this object. Indices are usually B-Trees, but other data structures can be used as well.
 """
+from heapq import merge
+from itertools import groupby
+from operator import itemgetter
+from threading import Lock
+
+from lstore.bplustree import BPlusTree
+from lstore.hash_index import HashIndex
+
+# kinds of index create_index can build: a B+-tree answers point and range
+# lookups, a hash index only point lookups, but with a dict probe
+BTREE = 'btree'
+HASH = 'hash'
+INDEX_KINDS = {BTREE: BPlusTree, HASH: HashIndex}
+# number of values Index.snapshot copies per hold of the lock
+SNAPSHOT_BATCH = 4096
 
 class Index:
 
     def __init__(self, table):
+        self.table = table
         # One index for each table. All our empty initially.
         self.indices = [None] *  table.num_columns
-        pass
+        self.indices[table.key] = BPlusTree()
+        # kind of each index, None for columns without one; kept in the catalog
+        self.kinds = [None] * table.num_columns
+        self.kinds[table.key] = BTREE
+        # the trees are shared by every thread running queries on the table
+        self.lock = Lock()
+        # (column, value, rid) of the entries an update or delete replaced ->
+        # marker of the change (see Table.release). They stay in the trees
+        # until it commits and no older snapshot runs, or it is rolled back:
+        # a locking reader looking up the old value still finds the record and
+        # meets its X lock, and a snapshot still finds the version it sees.
+        # Lookups leave them out unless asked for them.
+        self.stale = {}
 
     """
     # returns the location of all records with the given value on column "column"
+    # With stale set, records a change moved away from the value (or deleted)
+    # are returned as well, as long as their entries are kept. A column
+    # without an index is scanned, for the values a snapshot sees if given.
+    """
+
+    def locate(self, column, value, stale=False, snapshot=None):
+        index = self.indices[column]
+        if index is None:
+            return [rid for rid, current in self.table.scan(column, stale, snapshot) if current == value]
+        with self.lock:
+            rids = list(index.get(value))
+            if self.stale and not stale:
+                rids = [rid for rid in rids if (column, value, rid) not in self.stale]
+            return rids
+
+    """
+    # Returns, for each of the given values, the RIDs of the records with that
+    # value on column "column": one sorted pass over the index, or one scan of
+    # the column if it has none. stale and snapshot are as for locate.
     """
 
-    def locate(self, column, value):
-        pass
+    def locate_many(self, column, values, stale=False, snapshot=None):
+        index = self.indices[column]
+        if index is None:
+            wanted = set(values)
+            found = {}
+            for rid, current in self.table.scan(column, stale, snapshot):
+                if current in wanted:
+                    found.setdefault(current, []).append(rid)
+            return [found.get(value, []) for value in values]
+        with self.lock:
+            found = index.get_many(values)
+            if self.stale and not stale:
+                return [[rid for rid in found.get(value, ()) if (column, value, rid) not in self.stale]
+                        for value in values]
+            return [list(found.get(value, ())) for value in values]
 
     """
     # Returns the RIDs of all records with values in column "column" between "begin" and "end"
+    # A column without a B+-tree is scanned. stale and snapshot are as for locate.
+    """
+
+    def locate_range(self, begin, end, column, stale=False, snapshot=None):
+        index = self.indices[column]
+        if self.kinds[column] != BTREE:
+            return [rid for rid, current in self.table.scan(column, stale, snapshot) if begin <= current <= end]
+        with self.lock:
+            if self.stale and not stale:
+                return [rid for value, rids in index.range(begin, end) for rid in rids
+                        if (column, value, rid) not in self.stale]
+            return [rid for _, rids in index.range(begin, end) for rid in rids]
+
+    """
+    # Yields the RIDs of all records with values in column "column" between
+    # "begin" and "end" in batches of about batch_size, in value order if the
+    # column has a B+-tree and in RID order otherwise. The tree is latched for
+    # one batch at a time and the walk resumes after the last value seen.
+    # stale and snapshot are as for locate.
     """
 
-    def locate_range(self, begin, end, column):
-        pass
+    def locate_range_batches(self, begin, end, column, batch_size, stale=False, snapshot=None):
+        if self.kinds[column] != BTREE:
+            batch = []
+            for rid, current in self.table.scan(column, stale, snapshot):
+                if begin <= current <= end:
+                    batch.append(rid)
+                    if len(batch) == batch_size:
+                        yield batch
+                        batch = []
+            if batch:
+                yield batch
+            return
+        last = None
+        while True:
+            batch = []
+            with self.lock:
+                index = self.indices[column]
+                if self.kinds[column] != BTREE:
+                    return
+                for value, rids in index.range(begin if last is None else last, end):
+                    if value == last:
+                        continue
+                    if self.stale and not stale:
+                        rids = [rid for rid in rids if (column, value, rid) not in self.stale]
+                    batch.extend(rids)
+                    last = value
+                    if len(batch) >= batch_size:
+                        break
+            if not batch:
+                return
+            yield batch
 
     """
     # optional: Create index on specific column
+    # :param kind: BTREE or HASH, an existing index of another kind is rebuilt
+    # Changes to the table wait until the index is in place, so none is
+    # missed by the scan it is built from
     """
 
-    def create_index(self, column_number):
-        pass
+    def create_index(self, column_number, kind=BTREE):
+        if kind not in INDEX_KINDS:
+            raise ValueError("unknown index kind %r" % kind)
+        with self.table.frozen():
+            if self.indices[column_number] is not None and self.kinds[column_number] == kind:
+                return
+            # one streaming pass over the column pages, then a bulk build
+            if kind == HASH:
+                buckets = {}
+                for rid, value in self.table.scan(column_number):
+                    buckets.setdefault(value, []).append(rid)
+                index = HashIndex.bulk_load(buckets.items())
+            else:
+                entries = sorted((value, rid) for rid, value in self.table.scan(column_number))
+                grouped = ((value, [rid for _, rid in group]) for value, group in groupby(entries, key=itemgetter(0)))
+                index = BPlusTree.bulk_load(grouped)
+            with self.lock:
+                # a rebuilt index keeps the stale entries of the one it replaces
+                for column, value, rid in self.stale:
+                    if column == column_number:
+                        index.insert(value, rid)
+                self.indices[column_number] = index
+                self.kinds[column_number] = kind
 
     """
     # optional: Drop index of specific column
     """
 
     def drop_index(self, column_number):
-        pass
+        if column_number != self.table.key:
+            with self.lock:
+                self.indices[column_number] = None
+                self.kinds[column_number] = None
+                for entry in [entry for entry in self.stale if entry[0] == column_number]:
+                    del self.stale[entry]
+
+    """
+    # Returns the contents of every index as {column: [(value, rids), ...]},
+    # without stale entries: the changes that replaced them are in the log,
+    # and a rollback after recovery puts the entries back.
+    # The indices are copied SNAPSHOT_BATCH values at a time, each batch
+    # under a short hold of the lock, so queries go on during the copy. A
+    # change made meanwhile may or may not be in it; it is logged after the
+    # checkpoint began, and redoing it on top of the copy fixes it up.
+    """
+
+    def snapshot(self):
+        with self.lock:
+            columns = [column for column, index in enumerate(self.indices) if index is not None]
+        snapshot = {}
+        for column in columns:
+            items = self.__copy(column)
+            if items is not None:
+                snapshot[column] = items
+        return snapshot
+
+    # copies one index for snapshot(), None if it was dropped meanwhile
+    def __copy(self, column):
+        items = []
+        with self.lock:
+            if self.indices[column] is None:
+                return None
+            kind = self.kinds[column]
+            # a hash index is unordered, its values are copied in the order listed here
+            values = list(self.indices[column].buckets) if kind == HASH else None
+        position = 0
+        last = None
+        while True:
+            with self.lock:
+                index = self.indices[column]
+                if index is None:
+                    return None
+                if self.kinds[column] != kind:
+                    # rebuilt as another kind: start over
+                    return self.__copy(column)
+                if values is not None:
+                    batch = values[position:position + SNAPSHOT_BATCH]
+                    position += len(batch)
+                    found = index.get_many(batch)
+                    copied = [(value, found[value]) for value in batch if value in found]
+                else:
+                    copied = []
+                    for value, rids in index.items(last):
+                        if value != last:
+                            copied.append((value, rids))
+                            if len(copied) == SNAPSHOT_BATCH:
+                                break
+                    batch = copied
+                    if copied:
+                        last = copied[-1][0]
+                stale = self.stale
+                for value, rids in copied:
+                    rids = [rid for rid in rids if (column, value, rid) not in stale]
+                    if rids:
+                        items.append((value, rids))
+            if not batch:
+                return items
+
+    """
+    # Rebuilds the indices saved by snapshot() without touching the table,
+    # each of the kind the catalog recorded for its column (kinds)
+    """
+
+    def restore(self, snapshot, kinds):
+        self.indices = [None] * self.table.num_columns
+        self.kinds = [None] * self.table.num_columns
+        for column, items in snapshot.items():
+            kind = kinds[column] or BTREE
+            if kind == BTREE:
+                # the snapshot may predate a change of kind, a hash index is unordered
+                items = sorted(items, key=itemgetter(0))
+            self.indices[column] = INDEX_KINDS[kind].bulk_load(items)
+            self.kinds[column] = kind
+
+    """
+    # Adds the record's values to every index
+    # With redo set an entry already present is not added twice
+    """
+
+    def insert_record(self, columns, rid, redo=False):
+        with self.lock:
+            for column, index in enumerate(self.indices):
+                if index is not None:
+                    if redo:
+                        index.remove(columns[column], rid)
+                        self.stale.pop((column, columns[column], rid), None)
+                    index.insert(columns[column], rid)
+
+    """
+    # Adds records with consecutive RIDs from first_rid to every index. The
+    # entries of each B+-tree are sorted first: a small batch is inserted in
+    # key order, a batch at least as large as the tree is merged with it
+    # into a tree built bottom-up.
+    """
+
+    def insert_records(self, rows, first_rid):
+        with self.lock:
+            for column, index in enumerate(self.indices):
+                if index is None:
+                    continue
+                entries = sorted((row[column], first_rid + n) for n, row in enumerate(rows))
+                if self.kinds[column] == HASH or len(entries) < len(index):
+                    for value, rid in entries:
+                        index.insert(value, rid)
+                    continue
+                grouped = ((value, [rid for _, rid in group]) for value, group in groupby(entries, key=itemgetter(0)))
+                merged = merge(((value, list(rids)) for value, rids in index.items()), grouped, key=itemgetter(0))
+                self.indices[column] = BPlusTree.bulk_load(
+                    (value, [rid for _, rids in group for rid in rids]) for value, group in groupby(merged, key=itemgetter(0)))
+
+    """
+    # Removes the record's values from every index
+    # With pending set (the marker of the delete) the entries are only marked
+    # stale, to be dropped by release
+    """
+
+    def remove_record(self, columns, rid, pending=None):
+        with self.lock:
+            for column, index in enumerate(self.indices):
+                if index is None:
+                    continue
+                if pending is not None:
+                    self.stale[(column, columns[column], rid)] = pending
+                else:
+                    index.remove(columns[column], rid)
+                    self.stale.pop((column, columns[column], rid), None)
+
+    """
+    # Drops the entries of a record's old values, given as a {column: value}
+    # dict, that a committed change left stale with marker. Entries a later
+    # change put back, or marked stale again, are kept.
+    """
+
+    def release(self, rid, old_columns, marker):
+        with self.lock:
+            for column, value in old_columns.items():
+                entry = (column, value, rid)
+                if self.stale.get(entry) == marker:
+                    del self.stale[entry]
+                    index = self.indices[column]
+                    if index is not None:
+                        index.remove(value, rid)
+
+    """
+    # Moves a record from its old to its new values in the indices of the
+    # changed columns, given as {column: value} dicts. Indices of the other
+    # columns are never touched, and an unchanged value is left alone.
+    # With redo set an entry already present is not added twice
+    # With pending set (the marker of the update) the old entries are only
+    # marked stale, to be dropped by release
+    """
+
+    def update_record(self, rid, old_columns, new_columns, redo=False, pending=None):
+        if all(self.indices[column] is None for column in new_columns):
+            return
+        with self.lock:
+            stale = self.stale
+            for column, value in new_columns.items():
+                index = self.indices[column]
+                if index is None:
+                    continue
+                old, new = (column, old_columns[column], rid), (column, value, rid)
+                if redo:
+                    index.remove(old_columns[column], rid)
+                    index.remove(value, rid)
+                    index.insert(value, rid)
+                    stale.pop(old, None)
+                    stale.pop(new, None)
+                elif old_columns[column] != value:
+                    if pending is None and old not in stale and new not in stale:
+                        index.move(old_columns[column], value, rid)
+                        continue
+                    # an earlier change of the transaction may have left the new entry stale
+                    if stale.pop(new, None) is None:
+                        index.insert(value, rid)
+                    if pending is not None:
+                        stale[old] = pending
+                    else:
+                        stale.pop(old, None)
+                        index.remove(old_columns[column], rid)
@@ -0,0 +1,68 @@
+from threading import Lock
+
+# the lock table is split into this many independently latched shards, so
+# threads locking different records rarely wait on the same latch
+LOCK_SHARDS = 64
+
+SHARED = 'S'
+EXCLUSIVE = 'X'
+
+
+class LockManager:
+
+    """
+    # Shared/exclusive locks on the records of a table for strict two-phase
+    # locking with the no-wait policy: a request that conflicts fails at once
+    # instead of waiting, so transactions never deadlock and the caller
+    # aborts instead. A transaction holding the only shared lock on an item
+    # can upgrade it to exclusive.
+    # Items (RIDs, or ('key', value) for primary key values) are hashed onto
+    # shards, each a dict item -> [exclusive holder, set of shared holders]
+    # guarded by its own latch.
+    :param shards: int          #Number of shards of the lock table
+    """
+    def __init__(self, shards=LOCK_SHARDS):
+        self.shards = [{} for _ in range(shards)]
+        self.latches = [Lock() for _ in range(shards)]
+
+    """
+    # Locks item for transaction txn_id in mode SHARED or EXCLUSIVE
+    # Returns False if another transaction holds a conflicting lock
+    """
+    def acquire(self, txn_id, item, mode):
+        shard = hash(item) % len(self.shards)
+        with self.latches[shard]:
+            locks = self.shards[shard]
+            entry = locks.get(item)
+            if entry is None:
+                locks[item] = [txn_id, set()] if mode == EXCLUSIVE else [None, {txn_id}]
+                return True
+            holder, sharers = entry
+            if holder is not None:
+                return holder == txn_id
+            if mode == SHARED:
+                sharers.add(txn_id)
+                return True
+            if sharers - {txn_id}:
+                return False
+            # upgrade (or first lock after the sharers left)
+            sharers.clear()
+            entry[0] = txn_id
+            return True
+
+    """
+    # Releases the locks transaction txn_id holds on items
+    """
+    def release(self, txn_id, items):
+        for item in items:
+            shard = hash(item) % len(self.shards)
+            with self.latches[shard]:
+                locks = self.shards[shard]
+                entry = locks.get(item)
+                if entry is None:
+                    continue
+                if entry[0] == txn_id:
+                    entry[0] = None
+                entry[1].discard(txn_id)
+                if entry[0] is None and not entry[1]:
+                    del locks[item]
@@ -0,0 +1,203 @@
+import os
+import pickle
+import struct
+import zlib
+from threading import Condition, Thread
+from time import sleep
+
+LOG_FILE = 'wal.log'
+
+# durability modes of Transaction.commit
+FSYNC = 'fsync'     # every commit flushes and fsyncs the log before returning
+GROUP = 'group'     # concurrent commits share one fsync
+ASYNC = 'async'     # commits return at once, the log is flushed in the background
+
+# how long a group commit leader waits for other commits to join its fsync
+GROUP_COMMIT_DELAY = 0.001
+# how often the background flusher runs in async mode
+ASYNC_FLUSH_INTERVAL = 0.05
+
+# transaction id of queries run outside of any transaction, always committed
+AUTOCOMMIT = 0
+
+# every record is framed as (payload length, crc32 of payload) + payload
+FRAME = struct.Struct('<II')
+# starts the log file, so no record has LSN 0 (0 means "no record")
+MAGIC = b'LSTOREWL'
+
+
+class Log:
+
+    """
+    # Append-only write-ahead log shared by every table of a database.
+    # A record's LSN is its byte offset in the log file, so LSNs grow
+    # monotonically and a record can be read back without an index.
+    # Records are buffered in memory and written out by flush(), where one
+    # thread writes and fsyncs the whole buffer on behalf of every waiting
+    # commit (group commit).
+    :param path: string         #Database directory
+    :param durability: string   #FSYNC, GROUP or ASYNC
+    """
+    def __init__(self, path, durability=GROUP):
+        if durability not in (FSYNC, GROUP, ASYNC):
+            raise ValueError("unknown durability mode %r" % durability)
+        self.durability = durability
+        self.path = path
+        self.file = open(os.path.join(path, LOG_FILE), 'ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+            self.file.flush()
+        self.next_lsn = self.file.tell()
+        # every byte below this offset is on disk
+        self.durable_lsn = self.next_lsn
+        self.buffer = []
+        # first and last LSN written by each running transaction, the last
+        # one chains the transaction's records for undo
+        self.first_lsn = {}
+        self.last_lsn = {}
+        self.flushing = False
+        self.closed = False
+        self.cond = Condition()
+        if durability == ASYNC:
+            Thread(target=self.__flush_periodically, daemon=True).start()
+
+    """
+    # Buffers a log record
+    # Returns its LSN
+    """
+    def append(self, txn_id, kind, data=None):
+        with self.cond:
+            prev_lsn = self.last_lsn.get(txn_id, 0)
+            payload = pickle.dumps((txn_id, prev_lsn, kind, data), pickle.HIGHEST_PROTOCOL)
+            self.buffer.append(FRAME.pack(len(payload), zlib.crc32(payload)))
+            self.buffer.append(payload)
+            lsn = self.next_lsn
+            self.next_lsn += FRAME.size + len(payload)
+            if txn_id != AUTOCOMMIT:
+                self.first_lsn.setdefault(txn_id, lsn)
+                self.last_lsn[txn_id] = lsn
+            return lsn
+
+    """
+    # Logs the commit of a transaction and, unless the log is asynchronous,
+    # waits until the commit record is on disk
+    """
+    def commit(self, txn_id):
+        lsn = self.append(txn_id, 'commit')
+        self.end(txn_id)
+        if self.durability != ASYNC:
+            self.flush(lsn, self.durability == GROUP)
+        return lsn
+
+    """
+    # Logs the end of an aborted transaction
+    """
+    def abort(self, txn_id):
+        lsn = self.append(txn_id, 'abort')
+        self.end(txn_id)
+        return lsn
+
+    def end(self, txn_id):
+        with self.cond:
+            self.first_lsn.pop(txn_id, None)
+            self.last_lsn.pop(txn_id, None)
+
+    """
+    # Returns {txn_id: (first LSN, last LSN)} of every transaction that has
+    # logged changes but not ended yet
+    """
+    def active_transactions(self):
+        with self.cond:
+            return {txn_id: (self.first_lsn[txn_id], lsn) for txn_id, lsn in self.last_lsn.items()}
+
+    def size(self):
+        return self.next_lsn
+
+    """
+    # Blocks until the record at lsn (every record if lsn is None) and all
+    # records before it are on disk. The first caller to find no flush in
+    # progress becomes the leader and writes the buffer for everyone; the
+    # others wait for it.
+    """
+    def flush(self, lsn=None, wait_for_group=False):
+        with self.cond:
+            target = self.next_lsn if lsn is None else lsn + 1
+            while self.durable_lsn < target:
+                if self.flushing:
+                    self.cond.wait()
+                    continue
+                self.flushing = True
+                if wait_for_group:
+                    # let concurrent commits append before the fsync
+                    self.cond.release()
+                    sleep(GROUP_COMMIT_DELAY)
+                    self.cond.acquire()
+                buffer, self.buffer = self.buffer, []
+                end = self.next_lsn
+                self.cond.release()
+                try:
+                    self.file.write(b''.join(buffer))
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                finally:
+                    self.cond.acquire()
+                    self.flushing = False
+                    self.cond.notify_all()
+                self.durable_lsn = end
+
+    def close(self):
+        self.flush()
+        with self.cond:
+            self.closed = True
+        self.file.close()
+
+    def __flush_periodically(self):
+        while not self.closed:
+            sleep(ASYNC_FLUSH_INTERVAL)
+            if not self.closed:
+                self.flush()
+
+
+"""
+# Yields (lsn, txn_id, prev_lsn, kind, data) for every intact record of the
+# log file at path starting at LSN start. Stops at the first torn or corrupt
+# record, which marks the end of what reached the disk.
+"""
+def read_log(path, start=len(MAGIC)):
+    for lsn, end, payload in _frames(path, start):
+        yield (lsn,) + pickle.loads(payload)
+
+
+"""
+# Cuts a torn or corrupt tail off the log file at path, so records appended
+# from now on follow the last intact one
+"""
+def repair_log(path):
+    end = len(MAGIC)
+    for _, end, _ in _frames(path, end):
+        pass
+    file_path = os.path.join(path, LOG_FILE)
+    if os.path.exists(file_path):
+        with open(file_path, 'r+b') as f:
+            # a log too short to hold its magic is started over
+            f.truncate(end if os.fstat(f.fileno()).st_size >= end else 0)
+
+
+def _frames(path, start):
+    file_path = os.path.join(path, LOG_FILE)
+    if not os.path.exists(file_path):
+        return
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        lsn = start
+        while True:
+            header = f.read(FRAME.size)
+            if len(header) < FRAME.size:
+                return
+            length, checksum = FRAME.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                return
+            end = lsn + FRAME.size + length
+            yield lsn, end, payload
+            lsn = end
@@ -0,0 +1,121 @@
+from threading import Condition, Lock
+from time import time_ns
+
+# Every record version carries a timestamp in its TIMESTAMP column:
+#   >= 0    the commit timestamp of the change, from the clock below
+#   < 0     -txn_id of the transaction that made it, which has not committed
+#           yet (or committed before the database was reopened, its stamp
+#           lost in the crash)
+# The clock is seeded from the wall clock in nanoseconds, so it keeps growing
+# across restarts without being persisted.
+_now = 0
+_lock = Lock()
+# commit timestamps handed out by reserve() whose changes are not all in
+# place yet; snapshots stay below the oldest of them (see _visible)
+_committing = set()
+_published = Condition(_lock)
+# transactions with a lower id ran before the database was opened: recovery
+# rolled back those that did not commit, so their versions are committed
+_first_txn_id = 1
+# timestamp -> number of readers reading at it; until the oldest of them
+# ends, tables keep what it may still need (see Table.release)
+_snapshots = {}
+
+
+# the newest timestamp below every commit still in progress, call with _lock held
+def _visible():
+    return min(_committing) - 1 if _committing else _now
+
+
+"""
+# Returns a new snapshot timestamp: a reader sees exactly the versions
+# committed at or before it
+"""
+def snapshot():
+    with _lock:
+        return _visible()
+
+
+"""
+# Takes a snapshot for a reader, which must hand it back to end_snapshot()
+"""
+def begin_snapshot():
+    with _lock:
+        timestamp = _visible()
+        _snapshots[timestamp] = _snapshots.get(timestamp, 0) + 1
+        return timestamp
+
+
+def end_snapshot(timestamp):
+    with _lock:
+        if _snapshots[timestamp] == 1:
+            del _snapshots[timestamp]
+        else:
+            _snapshots[timestamp] -= 1
+
+
+"""
+# Returns the snapshot of the oldest running reader, None if there is none
+"""
+def oldest_snapshot():
+    with _lock:
+        return min(_snapshots, default=None)
+
+
+"""
+# Returns a fresh commit timestamp, to be written into the versions of the
+# changes committing at it. No snapshot includes it until publish(timestamp)
+# is called, once every version is in place.
+"""
+def reserve():
+    global _now
+    with _lock:
+        _now = max(_now + 1, time_ns())
+        _committing.add(_now)
+        return _now
+
+
+"""
+# Makes a reserved timestamp visible to new snapshots, then waits for the
+# commits with older timestamps to be published too, so a snapshot taken
+# after the change returns sees it. Must not be called with table locks
+# held, which an older commit may still need.
+"""
+def publish(timestamp):
+    with _lock:
+        _committing.discard(timestamp)
+        _published.notify_all()
+        while _committing and min(_committing) < timestamp:
+            _published.wait()
+
+
+"""
+# Assigns a commit timestamp and calls stamp(timestamp) to write it into the
+# committing transaction's versions. The timestamp is reserved (see
+# reserve) and the versions are stamped outside the lock, so other commits
+# and snapshots go on meanwhile; none of them includes the timestamp until
+# every version carries it, so a reader either sees all of a transaction's
+# changes or none of them.
+# Returns once the commits before it are published as well.
+"""
+def commit(stamp):
+    timestamp = reserve()
+    try:
+        stamp(timestamp)
+    finally:
+        publish(timestamp)
+    return timestamp
+
+
+"""
+# Marks transaction ids below txn_id as belonging to earlier runs of the database
+"""
+def set_first_txn_id(txn_id):
+    global _first_txn_id
+    _first_txn_id = txn_id
+
+
+def is_visible(timestamp, snapshot):
+    if timestamp >= 0:
+        return timestamp <= snapshot
+    return -timestamp < _first_txn_id
@@ -1,14 +1,99 @@
+from array import array
+from threading import Lock
+
+PAGE_SIZE = 4096
+# every column value is a signed 64-bit integer
+SLOT_SIZE = 8
+MIN_VALUE = -(1 << 63)
+MAX_VALUE = (1 << 63) - 1
+# the last slot is the page header: the LSN of the newest logged change
+PAGE_CAPACITY = PAGE_SIZE // SLOT_SIZE - 1
+LSN_SLOT = PAGE_CAPACITY
+# taken by a page copying a read-only buffer on its first write
+_copy_lock = Lock()
+
 
 class Page:
 
-    def __init__(self):
-        self.num_records = 0
-        self.data = bytearray(4096)
+    """
+    # A fixed size columnar page holding PAGE_CAPACITY 64-bit integer slots
+    # followed by its page LSN.
+    # The slots are a memoryview cast over the raw bytes, so reads and writes
+    # are native integer operations rather than int.to_bytes/from_bytes calls.
+    # A read-only buffer is read in place and copied on the first write.
+    :param data: optional 4096 byte buffer to wrap (a fresh zeroed buffer otherwise)
+    :param num_records: number of slots already written in data
+    """
+    def __init__(self, data=None, num_records=0):
+        self.num_records = num_records
+        self.data = bytearray(PAGE_SIZE) if data is None else data
+        self.slots = memoryview(self.data).cast('q')
+
+    @property
+    def lsn(self):
+        return self.slots[LSN_SLOT]
 
-    def has_capacity(self):
-        pass
+    @lsn.setter
+    def lsn(self, lsn):
+        self.__writable()
+        self.slots[LSN_SLOT] = lsn
 
+    def has_capacity(self, count=1):
+        return self.num_records + count <= PAGE_CAPACITY
+
+    """
+    # Appends value to the next free slot
+    # Returns the slot the value was written to
+    """
     def write(self, value):
+        self.__writable()
+        slot = self.num_records
+        self.slots[slot] = value
         self.num_records += 1
-        pass
+        return slot
+
+    """
+    # Appends values to consecutive free slots in a single copy
+    # Returns the slot of the first value written
+    """
+    def write_many(self, values):
+        start = self.num_records
+        end = start + len(values)
+        if end > PAGE_CAPACITY:
+            raise IndexError("page has room for %d more values, got %d" % (PAGE_CAPACITY - start, len(values)))
+        self.__writable()
+        self.slots[start:end] = array('q', values)
+        self.num_records = end
+        return start
+
+    """
+    # Overwrites an already written slot in place (indirection and schema columns)
+    """
+    def update(self, slot, value):
+        self.__writable()
+        self.slots[slot] = value
+
+    def read(self, slot):
+        return self.slots[slot]
+
+    """
+    # Returns the values stored in the given slots, in order
+    """
+    def read_many(self, slots):
+        values = self.slots
+        return [values[slot] for slot in slots]
+
+    """
+    # Returns the values of the contiguous slots [start, end) as a list
+    """
+    def read_range(self, start, end):
+        return self.slots[start:end].tolist()
 
+    # swaps a read-only buffer for a private copy; data is replaced before
+    # slots, so a writer that finds slots writable also has its buffer
+    def __writable(self):
+        if self.slots.readonly:
+            with _copy_lock:
+                if self.slots.readonly:
+                    self.data = bytearray(self.data)
+                    self.slots = memoryview(self.data).cast('q')
@@ -0,0 +1,85 @@
+import os
+
+from lstore.page import PAGE_CAPACITY
+from lstore.page_range import PageRange, RECORDS_PER_RANGE, RANGE_MASK, RANGE_SHIFT, is_tail_rid, tail_offset
+
+# written into the RID column of a deleted base record
+DELETED_RID = -1
+
+
+class PageDirectory:
+
+    """
+    # Maps a RID to the physical (page range, page, slot) holding it.
+    # The mapping is pure arithmetic on the RID, so the directory itself only
+    # stores the list of page ranges and costs nothing per record.
+    """
+    def __init__(self, table_name, total_columns, bufferpool):
+        self.table_name = table_name
+        self.total_columns = total_columns
+        self.bufferpool = bufferpool
+        self.ranges = []
+
+    """
+    # Returns the page range a new base record with this RID belongs to,
+    # creating it if the RID starts a new range
+    """
+    def range_for(self, rid):
+        range_index = rid // RECORDS_PER_RANGE
+        while range_index >= len(self.ranges):
+            range_index = len(self.ranges)
+            directory = os.path.join(self.table_name, str(range_index))
+            self.ranges.append(PageRange(directory, range_index, self.total_columns, self.bufferpool))
+        return self.ranges[range_index]
+
+    """
+    # Returns the page ranges' state for the catalog
+    """
+    def metadata(self):
+        return [page_range.metadata() for page_range in self.ranges]
+
+    """
+    # Recreates the page ranges saved by metadata()
+    """
+    def restore(self, metadata):
+        for range_index, range_metadata in enumerate(metadata):
+            self.range_for(range_index * RECORDS_PER_RANGE).restore(range_metadata)
+
+    """
+    # Returns (page_range, page_index, slot) for a base or tail RID
+    """
+    def locate(self, rid):
+        if is_tail_rid(rid):
+            page_range = self.ranges[(rid >> RANGE_SHIFT) & RANGE_MASK]
+            offset = tail_offset(rid)
+        else:
+            range_index, offset = divmod(rid, RECORDS_PER_RANGE)
+            page_range = self.ranges[range_index]
+        page_index, slot = divmod(offset, PAGE_CAPACITY)
+        return page_range, page_index, slot
+
+    def read(self, rid, column):
+        page_range, page_index, slot = self.locate(rid)
+        is_tail = is_tail_rid(rid)
+        page_id = page_range.page_id(is_tail, column, page_index)
+        bufferpool = self.bufferpool
+        page = bufferpool.pin(page_id, page_range.page_records(is_tail, page_index))
+        value = page.read(slot)
+        bufferpool.unpin(page_id)
+        return value
+
+    """
+    # Overwrites one column of a record, lsn being the log record of the change.
+    # With redo set the write is skipped if the page already holds that change.
+    """
+    def write(self, rid, column, value, lsn=0, redo=False):
+        page_range, page_index, slot = self.locate(rid)
+        is_tail = is_tail_rid(rid)
+        page_id = page_range.page_id(is_tail, column, page_index)
+        bufferpool = self.bufferpool
+        page = bufferpool.pin(page_id, page_range.page_records(is_tail, page_index))
+        if not redo or page.lsn <= lsn:
+            page.update(slot, value)
+            if lsn > page.lsn:
+                page.lsn = lsn
+        bufferpool.unpin(page_id, True)
@@ -0,0 +1,251 @@
+import os
+from contextlib import contextmanager
+from threading import RLock
+
+from lstore.page import PAGE_CAPACITY
+
+# number of base pages per column in one page range
+PAGES_PER_RANGE = 16
+RECORDS_PER_RANGE = PAGES_PER_RANGE * PAGE_CAPACITY
+
+# Base RIDs are dense integers, so a base RID is its own address:
+#   range = rid // RECORDS_PER_RANGE, offset = rid % RECORDS_PER_RANGE
+# Tail RIDs set TAIL_RID_FLAG and pack the owning range above the tail offset.
+TAIL_RID_FLAG = 1 << 62
+RANGE_SHIFT = 32
+OFFSET_MASK = (1 << RANGE_SHIFT) - 1
+RANGE_MASK = (1 << (62 - RANGE_SHIFT)) - 1
+
+
+def is_tail_rid(rid):
+    return rid >= 0 and rid & TAIL_RID_FLAG != 0
+
+
+def tail_rid(range_index, offset):
+    return TAIL_RID_FLAG | (range_index << RANGE_SHIFT) | offset
+
+
+def tail_offset(rid):
+    return rid & OFFSET_MASK
+
+
+class PageRange:
+
+    """
+    # A page range holds RECORDS_PER_RANGE base records together with the
+    # append-only tail pages that store their updates. Pages are stored column
+    # by column, one file per column, and accessed through the buffer pool.
+    :param directory: string    #Directory of the range's files, relative to the database
+    :param index: int           #Position of this range in the page directory
+    :param total_columns: int   #Metadata columns plus user columns
+    :param bufferpool: BufferPool
+    """
+    def __init__(self, directory, index, total_columns, bufferpool):
+        self.directory = directory
+        self.index = index
+        self.total_columns = total_columns
+        self.bufferpool = bufferpool
+        self.num_base_records = 0
+        self.num_tail_records = 0
+        # bumped by every merge that rewrites a base column
+        self.generations = [0] * total_columns
+        self.base_files = [self.__base_file(column, 0) for column in range(total_columns)]
+        self.tail_files = [os.path.join(directory, 'tail_%d' % column) for column in range(total_columns)]
+        # tail page sequence: tail records below this offset are merged into the base pages
+        self.tps = 0
+        self.merging = False
+        # first tail offsets of updates by running transactions, merges stop below them
+        self.pending_tails = set()
+        # base files replaced by merges, deleted once a checkpoint no longer needs them
+        self.retired = []
+        # serializes appends and version chain changes with merges
+        self.lock = RLock()
+
+    def __base_file(self, column, generation):
+        name = 'base_%d' % column if generation == 0 else 'base_%d.%d' % (column, generation)
+        return os.path.join(self.directory, name)
+
+    def has_capacity(self):
+        return self.num_base_records < RECORDS_PER_RANGE
+
+    """
+    # Returns the buffer pool id of a page
+    """
+    def page_id(self, is_tail, column, page_index):
+        files = self.tail_files if is_tail else self.base_files
+        return files[column], page_index
+
+    """
+    # Returns how many slots of a page are in use
+    """
+    def page_records(self, is_tail, page_index):
+        count = self.num_tail_records if is_tail else self.num_base_records
+        return max(0, min(PAGE_CAPACITY, count - page_index * PAGE_CAPACITY))
+
+    def num_pages(self, is_tail):
+        count = self.num_tail_records if is_tail else self.num_base_records
+        return (count + PAGE_CAPACITY - 1) // PAGE_CAPACITY
+
+    """
+    # Pins a page for the duration of a with block
+    """
+    @contextmanager
+    def pinned(self, is_tail, column, page_index, dirty=False):
+        page_id = self.page_id(is_tail, column, page_index)
+        page = self.bufferpool.pin(page_id, self.page_records(is_tail, page_index))
+        try:
+            yield page
+        finally:
+            self.bufferpool.unpin(page_id, dirty)
+
+    """
+    # Appends one base record (a value per column), lsn being the log record
+    # of the insert
+    # Returns the offset of the record inside this range
+    """
+    def append_base(self, values, lsn=0):
+        with self.lock:
+            offset = self.num_base_records
+            self.__append(False, offset, values, lsn)
+            self.num_base_records += 1
+        return offset
+
+    """
+    # Appends base records (a list of values per record) that all fit on the
+    # current base page, writing each column with one copy, lsn being the log
+    # record of the insert
+    # Returns the offset of the first record inside this range
+    """
+    def append_base_many(self, rows, lsn=0):
+        with self.lock:
+            offset = self.num_base_records
+            page_index, slot = divmod(offset, PAGE_CAPACITY)
+            bufferpool = self.bufferpool
+            for column, values in enumerate(zip(*rows)):
+                page_id = (self.base_files[column], page_index)
+                page = bufferpool.pin(page_id, slot)
+                try:
+                    # a reader may have loaded the page from disk before these records were counted
+                    page.num_records = slot
+                    page.write_many(values)
+                    if lsn > page.lsn:
+                        page.lsn = lsn
+                finally:
+                    bufferpool.unpin(page_id, True)
+            self.num_base_records += len(rows)
+        return offset
+
+    """
+    # Returns the RID the next count tail records will get
+    """
+    def next_tail_rids(self, count):
+        return [tail_rid(self.index, self.num_tail_records + i) for i in range(count)]
+
+    """
+    # Appends one tail record (a value per column), filling in its RID column
+    # Returns the RID of the new tail record
+    """
+    def append_tail(self, values, rid_column, lsn=0):
+        with self.lock:
+            offset = self.num_tail_records
+            values[rid_column] = rid = tail_rid(self.index, offset)
+            self.__append(True, offset, values, lsn)
+            self.num_tail_records += 1
+        return rid
+
+    """
+    # Rewrites a base or tail record at offset during recovery, skipping the
+    # pages whose LSN shows they already hold the change logged at lsn
+    """
+    def redo_append(self, is_tail, offset, values, lsn):
+        page_index, slot = divmod(offset, PAGE_CAPACITY)
+        bufferpool = self.bufferpool
+        for column, value in enumerate(values):
+            page_id = self.page_id(is_tail, column, page_index)
+            page = bufferpool.pin(page_id, slot)
+            # <= since one log record may write several slots of a page
+            if page.lsn <= lsn:
+                page.update(slot, value)
+                page.lsn = lsn
+            bufferpool.unpin(page_id, True)
+        if is_tail:
+            self.num_tail_records = max(self.num_tail_records, offset + 1)
+        else:
+            self.num_base_records = max(self.num_base_records, offset + 1)
+
+    """
+    # Returns the file a merge of a base column writes its new pages to
+    """
+    def merge_file(self, column):
+        return self.__base_file(column, self.generations[column] + 1)
+
+    """
+    # Switches base columns over to the pages their merge wrote and
+    # publishes the new tps. Must be called with the range lock held.
+    # Replaced files stay on disk until release_retired(): the last
+    # checkpoint's catalog still refers to them, and a query that looked up a
+    # page id just before this swap can still pin it. An in-memory range has
+    # no checkpoints and drops them at the following swap instead.
+    """
+    def swap_base(self, columns, tps):
+        if self.bufferpool.path is None:
+            self.release_retired(len(self.retired))
+        for column in columns:
+            self.retired.append(self.base_files[column])
+            self.generations[column] += 1
+            self.base_files[column] = self.__base_file(column, self.generations[column])
+        self.tps = tps
+
+    """
+    # Deletes the files of the first count retired base columns
+    """
+    def release_retired(self, count):
+        for file in self.retired[:count]:
+            self.bufferpool.discard(file)
+        del self.retired[:count]
+
+    """
+    # Returns the range's state for the catalog
+    """
+    def metadata(self):
+        with self.lock:
+            return {
+                'num_base_records': self.num_base_records,
+                'num_tail_records': self.num_tail_records,
+                'tps': self.tps,
+                'generations': list(self.generations),
+            }
+
+    """
+    # Restores the state saved by metadata()
+    """
+    def restore(self, metadata):
+        self.num_base_records = metadata['num_base_records']
+        self.num_tail_records = metadata['num_tail_records']
+        self.tps = metadata['tps']
+        self.generations = metadata['generations']
+        self.base_files = [self.__base_file(column, generation) for column, generation in enumerate(self.generations)]
+        for column, generation in enumerate(self.generations):
+            # left behind by a crash before the retired files were deleted
+            if generation > 0:
+                self.bufferpool.discard(self.__base_file(column, generation - 1))
+            # written by merges that finished after the checkpoint
+            stale = generation + 1
+            while self.bufferpool.discard(self.__base_file(column, stale)):
+                stale += 1
+
+    def __append(self, is_tail, offset, values, lsn):
+        page_index, slot = divmod(offset, PAGE_CAPACITY)
+        files = self.tail_files if is_tail else self.base_files
+        bufferpool = self.bufferpool
+        for column, value in enumerate(values):
+            page_id = (files[column], page_index)
+            page = bufferpool.pin(page_id, slot)
+            try:
+                # a reader may have loaded the page from disk before this record was counted
+                page.num_records = slot
+                page.write(value)
+                if lsn > page.lsn:
+                    page.lsn = lsn
+            finally:
+                bufferpool.unpin(page_id, True)
@@ -1,5 +1,11 @@
-from lstore.table import Table, Record
+from lstore.table import Table, Record, LazyRecord
 from lstore.index import Index
+from lstore.lock_manager import SHARED, EXCLUSIVE
+from lstore.page import MIN_VALUE, MAX_VALUE
+from lstore.transaction import current_transaction
+
+# number of records a scan locates and reads at a time
+SCAN_BATCH = 1024
 
 
 class Query:
@@ -21,7 +27,14 @@ class Query:
     # Return False if record doesn't exist or is locked due to 2PL
     """
     def delete(self, primary_key):
-        pass
+        # the key is locked first, a running transaction may be changing it
+        if not self.__lock(('key', primary_key), EXCLUSIVE):
+            return False
+        rid = self.__locate_key(primary_key)
+        if rid is None or not self.__lock(rid, EXCLUSIVE):
+            return False
+        self.table.delete_record(rid, current_transaction())
+        return True
     
     
     """
@@ -30,8 +43,44 @@ class Query:
     # Returns False if insert fails for whatever reason
     """
     def insert(self, *columns):
-        schema_encoding = '0' * self.table.num_columns
-        pass
+        if len(columns) != self.table.num_columns or None in columns or not self.__fits(columns):
+            return False
+        # the key value is locked so no other transaction can insert it too
+        if not self.__lock(('key', columns[self.table.key]), EXCLUSIVE):
+            return False
+        if self.__locate_key(columns[self.table.key]) is not None:
+            return False
+        # no column of a new record is updated yet, its schema encoding is empty
+        rid = self.table.insert_record(columns, 0, current_transaction())
+        return self.__lock(rid, EXCLUSIVE)
+
+    
+    """
+    # Insert many records at once
+    # :param rows: iterable of records, each a sequence of column values
+    # The records are written a base page at a time and the indices are
+    # built once for the whole batch, see Table.insert_records.
+    # Return True upon succesful insertion of every record
+    # Returns False, inserting none, if a record is malformed or its key already exists
+    """
+    def insert_many(self, rows):
+        rows = [tuple(row) for row in rows]
+        key = self.table.key
+        keys = [row[key] for row in rows if len(row) == self.table.num_columns and None not in row and self.__fits(row)]
+        if len(keys) != len(rows) or len(set(keys)) != len(keys):
+            return False
+        for value in keys:
+            if not self.__lock(('key', value), EXCLUSIVE):
+                return False
+        if any(self.table.index.locate_many(key, keys)):
+            return False
+        if not rows:
+            return True
+        first_rid = self.table.insert_records(rows, current_transaction())
+        for rid in range(first_rid, first_rid + len(rows)):
+            if not self.__lock(rid, EXCLUSIVE):
+                return False
+        return True
 
     
     """
@@ -39,12 +88,13 @@ class Query:
     # :param search_key: the value you want to search based on
     # :param search_key_index: the column index you want to search based on
     # :param projected_columns_index: what columns to return. array of 1 or 0 values.
+    # :param lazy: return LazyRecord objects, whose projected columns are read on first access
     # Returns a list of Record objects upon success
     # Returns False if record locked by TPL
     # Assume that select will never be called on a key that doesn't exist
     """
-    def select(self, search_key, search_key_index, projected_columns_index):
-        pass
+    def select(self, search_key, search_key_index, projected_columns_index, lazy=False):
+        return self.select_version(search_key, search_key_index, projected_columns_index, 0, lazy)
 
     
     """
@@ -53,21 +103,163 @@ class Query:
     # :param search_key_index: the column index you want to search based on
     # :param projected_columns_index: what columns to return. array of 1 or 0 values.
     # :param relative_version: the relative version of the record you need to retreive.
+    # :param lazy: return LazyRecord objects, whose projected columns are read on first access
     # Returns a list of Record objects upon success
     # Returns False if record locked by TPL
     # Assume that select will never be called on a key that doesn't exist
     """
-    def select_version(self, search_key, search_key_index, projected_columns_index, relative_version):
-        pass
+    def select_version(self, search_key, search_key_index, projected_columns_index, relative_version, lazy=False):
+        snapshot = self.__snapshot()
+        locking = self.__locking()
+        projected_columns_index = tuple(projected_columns_index)
+        columns = self.__columns_to_read(search_key_index, projected_columns_index, lazy)
+        records = []
+        stale = locking or snapshot is not None
+        for rid in self.table.index.locate(search_key_index, search_key, stale, snapshot):
+            if not self.__lock(rid, SHARED):
+                return False
+            if locking and not self.__holds(rid, search_key_index, search_key):
+                continue
+            # a lazy record reads the rest of its columns at the version read here
+            bound = self.table.tail_bound(rid) if lazy else None
+            values = self.table.read_columns(rid, columns, relative_version, snapshot, bound)
+            if values is None:
+                continue
+            # the index only knows the latest values, which a snapshot may not see yet
+            if snapshot is not None and values[columns.index(search_key_index)] != search_key:
+                continue
+            records.append(self.__record(rid, columns, values, projected_columns_index, lazy, relative_version, snapshot, bound))
+        return records
 
     
+    """
+    # Read the matching records of many search keys at once
+    # :param search_keys: the values you want to search based on
+    # :param search_key_index: the column index you want to search based on
+    # :param projected_columns_index: what columns to return. array of 1 or 0 values.
+    # :param lazy: return LazyRecord objects, whose projected columns are read on first access
+    # The keys are looked up in one pass over the index and the records read
+    # a base page at a time.
+    # Returns a list holding, for each search key in order, the list of its Record objects
+    # Returns False if a record is locked by TPL
+    """
+    def select_many(self, search_keys, search_key_index, projected_columns_index, lazy=False):
+        snapshot = self.__snapshot()
+        projected_columns_index = tuple(projected_columns_index)
+        search_keys = list(search_keys)
+        locking = self.__locking()
+        located = self.table.index.locate_many(search_key_index, search_keys, locking or snapshot is not None, snapshot)
+        rids = [rid for key_rids in located for rid in key_rids]
+        for rid in rids:
+            if not self.__lock(rid, SHARED):
+                return False
+        columns = self.__columns_to_read(search_key_index, projected_columns_index, lazy)
+        search_position = columns.index(search_key_index)
+        bounds = {} if lazy else None
+        values = iter(self.table.read_records(rids, columns, snapshot, bounds))
+        results = []
+        for search_key, key_rids in zip(search_keys, located):
+            records = []
+            for rid in key_rids:
+                record = next(values)
+                if record is None:
+                    continue
+                # the index only knows the latest values, which a snapshot may not
+                # see yet, and a locking read also finds records that no longer match
+                if (snapshot is not None or locking) and record[search_position] != search_key:
+                    continue
+                records.append(self.__record(rid, columns, record, projected_columns_index, lazy, 0, snapshot, None if bounds is None else bounds[rid]))
+            results.append(records)
+        return results
+
+    
+    """
+    # Streams the records whose value on a column lies in a range
+    # :param column: the column index to scan, using its index if it has one
+    # :param begin: int             # Start of the range of values
+    # :param end: int               # End of the range of values
+    # :param projected_columns_index: what columns to return. array of 1 or 0 values.
+    # :param lazy: yield LazyRecord objects, whose projected columns are read on first access
+    # Returns a generator of Record objects, in value order if the column is
+    # indexed and in RID order otherwise. Records are located and read
+    # SCAN_BATCH at a time and pages stay pinned only while they are read, so
+    # memory is bounded and the caller can stop whenever it likes.
+    # In a transaction the scan runs to the end at once, as its locks and
+    # snapshot end with the transaction, and returns a list of the records.
+    # Returns False if a record is locked by TPL
+    """
+    def scan(self, column, begin, end, projected_columns_index, lazy=False):
+        transaction = current_transaction()
+        snapshot = self.__snapshot()
+        projected_columns_index = tuple(projected_columns_index)
+        columns = self.__columns_to_read(column, projected_columns_index, lazy)
+        batches = self.__scan(transaction, snapshot, column, begin, end, projected_columns_index, columns, lazy)
+        if transaction is None:
+            return (record for batch in batches for record in batch)
+        records = []
+        for batch in batches:
+            if batch is False:
+                return False
+            records.extend(batch)
+        return records
+
+    # yields the records of a scan a batch at a time, False on a lock conflict
+    def __scan(self, transaction, snapshot, column, begin, end, projected_columns_index, columns, lazy):
+        position = columns.index(column)
+        locking = transaction is not None and transaction.snapshot is None
+        stale = locking or snapshot is not None
+        # a record may be found under its old value and under its new one
+        seen = set()
+        for rids in self.table.index.locate_range_batches(begin, end, column, SCAN_BATCH, stale, snapshot):
+            if stale:
+                unseen = []
+                for rid in rids:
+                    if rid not in seen:
+                        seen.add(rid)
+                        unseen.append(rid)
+                rids = unseen
+            if locking:
+                for rid in rids:
+                    if not transaction.lock(self.table.lock_manager, rid, SHARED):
+                        yield False
+                        return
+            records = []
+            bounds = {} if lazy else None
+            for rid, values in zip(rids, self.table.read_records(rids, columns, snapshot, bounds)):
+                if values is None:
+                    continue
+                # the index only knows the latest values, which a snapshot may not
+                # see yet, and a locking read also finds records that no longer match
+                if stale and not begin <= values[position] <= end:
+                    continue
+                records.append(self.__record(rid, columns, values, projected_columns_index, lazy, 0, snapshot, None if bounds is None else bounds[rid]))
+            yield records
+
     """
     # Update a record with specified key and columns
     # Returns True if update is succesful
     # Returns False if no records exist with given key or if the target record cannot be accessed due to 2PL locking
     """
     def update(self, primary_key, *columns):
-        pass
+        if len(columns) != self.table.num_columns or not self.__fits(columns):
+            return False
+        # the key is locked first, a running transaction may be changing it
+        if not self.__lock(('key', primary_key), EXCLUSIVE):
+            return False
+        rid = self.__locate_key(primary_key)
+        if rid is None or not self.__lock(rid, EXCLUSIVE):
+            return False
+        new_key = columns[self.table.key]
+        if new_key is not None and new_key != primary_key:
+            if not self.__lock(('key', new_key), EXCLUSIVE):
+                return False
+            if self.__locate_key(new_key) is not None:
+                return False
+        schema_encoding = self.table.schema_encoding(column for column, value in enumerate(columns) if value is not None)
+        if not schema_encoding:
+            return True
+        self.table.update_record(rid, columns, schema_encoding, current_transaction())
+        return True
 
     
     """
@@ -79,7 +271,7 @@ class Query:
     # Returns False if no record exists in the given range
     """
     def sum(self, start_range, end_range, aggregate_column_index):
-        pass
+        return self.sum_version(start_range, end_range, aggregate_column_index, 0)
 
     
     """
@@ -92,7 +284,26 @@ class Query:
     # Returns False if no record exists in the given range
     """
     def sum_version(self, start_range, end_range, aggregate_column_index, relative_version):
-        pass
+        snapshot = self.__snapshot()
+        locking = self.__locking()
+        key_range = None
+        rids = self.table.index.locate_range(start_range, end_range, self.table.key, locking or snapshot is not None, snapshot)
+        if snapshot is not None:
+            # a record may be found under its old key and under its new one
+            rids = list(set(rids))
+            key_range = (start_range, end_range)
+        if locking:
+            # with every record that had a key in the range locked, the keys in it are settled
+            for rid in rids:
+                if not self.__lock(rid, SHARED):
+                    return False
+            rids = self.table.index.locate_range(start_range, end_range, self.table.key)
+        if not rids:
+            return False
+        for rid in rids:
+            if not self.__lock(rid, SHARED):
+                return False
+        return self.table.sum_column(rids, aggregate_column_index, relative_version, snapshot, key_range)
 
     
     """
@@ -104,10 +315,72 @@ class Query:
     # Returns False if no record matches key or if target record is locked by 2PL.
     """
     def increment(self, key, column):
-        r = self.select(key, self.table.key, [1] * self.table.num_columns)[0]
-        if r is not False:
+        r = self.select(key, self.table.key, [1] * self.table.num_columns)
+        if r:
             updated_columns = [None] * self.table.num_columns
-            updated_columns[column] = r[column] + 1
+            updated_columns[column] = r[0].columns[column] + 1
             u = self.update(key, *updated_columns)
             return u
         return False
+
+    """
+    # Returns whether every value given for a column fits the int64 slots of
+    # the pages, None standing for a column left as it is. Checked before
+    # anything is logged, so the log never holds a change the pages reject.
+    """
+    def __fits(self, columns):
+        return all(value is None or (isinstance(value, int) and MIN_VALUE <= value <= MAX_VALUE) for value in columns)
+
+    """
+    # Returns the RID of the live record with the given primary key, or None
+    """
+    def __locate_key(self, primary_key):
+        rids = self.table.index.locate(self.table.key, primary_key)
+        return rids[0] if rids else None
+
+    """
+    # Returns the columns a select reads: the projected ones plus the search
+    # and primary key columns it needs itself, so only their pages are touched.
+    # A lazy select leaves the projected columns to its records.
+    """
+    def __columns_to_read(self, search_key_index, projected_columns_index, lazy):
+        columns = {search_key_index, self.table.key}
+        if not lazy:
+            columns.update(column for column, projected in enumerate(projected_columns_index) if projected)
+        return sorted(columns)
+
+    # builds the Record of a select from the values of the columns it read
+    def __record(self, rid, columns, values, projected_columns_index, lazy, relative_version, snapshot, bound):
+        values = dict(zip(columns, values))
+        if lazy:
+            return LazyRecord(self.table, rid, values[self.table.key], values, projected_columns_index, relative_version, snapshot, bound)
+        projected = [values[column] if projected else None for column, projected in enumerate(projected_columns_index)]
+        return Record(rid, values[self.table.key], projected)
+
+    """
+    # Locks item for the running transaction (strict 2PL, no-wait)
+    # Returns False if it is locked by another transaction; queries run
+    # outside a transaction or in a snapshot read take no locks
+    """
+    def __lock(self, item, mode):
+        if not self.__locking():
+            return True
+        return current_transaction().lock(self.table.lock_manager, item, mode)
+
+    # whether queries lock what they read: in a transaction that writes
+    def __locking(self):
+        transaction = current_transaction()
+        return transaction is not None and transaction.snapshot is None
+
+    """
+    # Returns whether a record a locking read found in the index, stale
+    # entries included (see Index.stale), still has value on column now that
+    # it is locked: a change that moved it away may have committed since
+    """
+    def __holds(self, rid, column, value):
+        return not self.table.is_deleted(rid) and self.table.read_value(rid, column) == value
+
+    # the snapshot a read-only transaction reads, None for the latest versions
+    def __snapshot(self):
+        transaction = current_transaction()
+        return None if transaction is None else transaction.snapshot
@@ -0,0 +1,86 @@
+from lstore.log import AUTOCOMMIT, MAGIC, read_log
+
+# log records that change a table, redone and undone through Table
+TABLE_CHANGES = ('insert', 'insert_many', 'update', 'delete')
+# compensation records written while rolling back, redone but never undone;
+# their last data item is the LSN to continue the rollback at (undo next)
+COMPENSATIONS = ('undo_insert', 'undo_insert_many', 'undo_update', 'undo_delete')
+
+
+"""
+# ARIES restart of a database whose tables were restored from the last
+# checkpoint's catalog and index snapshots:
+#   analysis: finds the transactions that never ended (losers) in the log
+#             written since the checkpoint began
+#   redo:     repeats history from the oldest change the checkpoint's dirty
+#             page table says may be missing on disk; page LSNs skip pages
+#             that already hold a change
+#   undo:     rolls the losers back newest change first, logging a
+#             compensation record for every change undone, so a crash during
+#             recovery never undoes anything twice
+# Only the log since the checkpoint (and the changes of transactions still
+# running at that point) is read, whatever the size of the tables.
+# Returns the highest transaction id found in the log
+"""
+def recover(db, checkpoint):
+    tables = {table.name: table for table in db.tables}
+    begin = start = len(MAGIC)
+    checkpoint_end = None
+    if checkpoint is not None:
+        begin = checkpoint['begin']
+        checkpoint_end = checkpoint['end']
+        state = next(read_log(db.path, checkpoint_end))[4]
+        start = min([begin] + list(state['dpt'].values()) + [first for first, _ in state['att'].values()])
+    records = {}
+    # loser txn_id -> LSN of its last record
+    losers = {}
+    ended = set()
+    max_txn_id = 0
+    for lsn, txn_id, prev_lsn, kind, data in read_log(db.path, start):
+        records[lsn] = (txn_id, prev_lsn, kind, data)
+        max_txn_id = max(max_txn_id, txn_id)
+        if lsn == checkpoint_end:
+            # transactions running when the checkpoint was taken
+            for loser, (_, last) in data['att'].items():
+                if loser not in ended:
+                    losers[loser] = max(losers.get(loser, 0), last)
+        if lsn < begin or txn_id == AUTOCOMMIT:
+            continue
+        if kind in ('commit', 'abort'):
+            losers.pop(txn_id, None)
+            ended.add(txn_id)
+        elif kind in TABLE_CHANGES or kind in COMPENSATIONS:
+            losers[txn_id] = lsn
+    for lsn, (txn_id, prev_lsn, kind, data) in records.items():
+        if kind in TABLE_CHANGES or kind in COMPENSATIONS:
+            table = tables.get(data[0])
+            if table is not None and lsn >= table.created_lsn:
+                table.redo(lsn, kind, data[1:])
+    rollback(db.log, tables, records, losers)
+    return max_txn_id
+
+
+"""
+# Rolls back the transactions in {txn_id: LSN of last record}, undoing their
+# changes in reverse LSN order across all of them and ending each with an
+# abort record. records maps an LSN to its (txn_id, prev_lsn, kind, data).
+"""
+def rollback(log, tables, records, transactions):
+    transactions = dict(transactions)
+    while transactions:
+        txn_id = max(transactions, key=transactions.get)
+        record_lsn = transactions[txn_id]
+        _, prev_lsn, kind, data = records[record_lsn]
+        undo_next = prev_lsn
+        if kind in COMPENSATIONS:
+            # everything up to this record is already undone
+            undo_next = data[-1]
+        elif kind in TABLE_CHANGES:
+            table = tables.get(data[0])
+            if table is not None and record_lsn >= table.created_lsn:
+                table.rollback_change(txn_id, kind, data[1:], prev_lsn)
+        if undo_next:
+            transactions[txn_id] = undo_next
+        else:
+            del transactions[txn_id]
+            log.abort(txn_id)
@@ -1,35 +1,840 @@
+from lstore.bufferpool import BufferPool
 from lstore.index import Index
-from time import time
+from lstore.lock_manager import LockManager
+from lstore.log import AUTOCOMMIT
+from lstore.mvcc import is_visible, oldest_snapshot, publish, reserve
+from lstore.page import PAGE_CAPACITY
+from lstore.page_directory import PageDirectory, DELETED_RID
+from lstore.page_range import RECORDS_PER_RANGE, is_tail_rid, tail_offset
+from contextlib import contextmanager
+from heapq import heappop, heappush
+from itertools import count
+from queue import Queue
+from threading import Lock, Thread
 
 INDIRECTION_COLUMN = 0
 RID_COLUMN = 1
 TIMESTAMP_COLUMN = 2
 SCHEMA_ENCODING_COLUMN = 3
+# user columns are stored after the metadata columns
+METADATA_COLUMNS = 4
+
+# number of unmerged tail records that triggers a merge of their page range
+MERGE_THRESHOLD = 2 * PAGE_CAPACITY
+# schema encodings are int64 page values holding a bit per column and the
+# snapshot flag above them, so the sign bit leaves room for 62 columns
+MAX_COLUMNS = 62
 
 
 class Record:
 
+    # no per-record __dict__, large results allocate one small object per row
+    __slots__ = ('rid', 'key', 'columns')
+
     def __init__(self, rid, key, columns):
         self.rid = rid
         self.key = key
         self.columns = columns
 
+
+class LazyRecord:
+
+    """
+    # A record whose projected columns are only read from the table when
+    # first accessed, through record[column] one at a time or through
+    # columns all at once (None for columns not projected). Values are
+    # decoded once and kept.
+    # Every column is read at the version the select found, whatever changed
+    # since: tail records appended after it are skipped (see Table.tail_bound)
+    # and a snapshot read keeps reading its snapshot.
+    :param values: dict         #Values already read, by column
+    :param projected: list      #Mask of the columns to return, 1 or 0 per column
+    :param bound: int           #Tail bound of the record's page range when it was selected
+    """
+    __slots__ = ('rid', 'key', 'table', 'values', 'projected', 'relative_version', 'snapshot', 'bound')
+
+    def __init__(self, table, rid, key, values, projected, relative_version=0, snapshot=None, bound=None):
+        self.table = table
+        self.rid = rid
+        self.key = key
+        self.values = values
+        self.projected = projected
+        self.relative_version = relative_version
+        self.snapshot = snapshot
+        self.bound = bound
+
+    def __getitem__(self, column):
+        if not self.projected[column]:
+            return None
+        if column not in self.values:
+            self.__read([column])
+        return self.values[column]
+
+    @property
+    def columns(self):
+        missing = [column for column, projected in enumerate(self.projected) if projected and column not in self.values]
+        if missing:
+            self.__read(missing)
+        return [self.values[column] if projected else None for column, projected in enumerate(self.projected)]
+
+    def __read(self, columns):
+        values = self.table.read_version(self.rid, columns, self.relative_version, self.snapshot, self.bound)
+        self.values.update(zip(columns, values))
+
 class Table:
 
     """
     :param name: string         #Table name
-    :param num_columns: int     #Number of Columns: all columns are integer
+    :param num_columns: int     #Number of Columns: all columns are integer, at most MAX_COLUMNS
     :param key: int             #Index of table key in columns
+    :param bufferpool: BufferPool #Pool holding the table's pages, a private in-memory pool if None
+    :param log: Log             #Write-ahead log of the database, None if changes are not logged
+    :param cumulative: bool     #Whether every tail record carries all the columns updated so far
     """
-    def __init__(self, name, num_columns, key):
+    def __init__(self, name, num_columns, key, bufferpool=None, log=None, cumulative=False):
+        if not 0 < num_columns <= MAX_COLUMNS:
+            raise ValueError("a table has 1 to %d columns, got %d" % (MAX_COLUMNS, num_columns))
         self.name = name
         self.key = key
         self.num_columns = num_columns
-        self.page_directory = {}
+        # a cumulative tail record holds the latest value of every column updated
+        # so far, so reading the latest version stops at the first tail record
+        self.cumulative = cumulative
+        # schema encoding bits, see column_updated
+        self.column_bits = [1 << (num_columns - 1 - column) for column in range(num_columns)]
+        self.snapshot_flag = 1 << num_columns
+        self.total_columns = METADATA_COLUMNS + num_columns
+        self.bufferpool = BufferPool() if bufferpool is None else bufferpool
+        self.page_directory = PageDirectory(name, self.total_columns, self.bufferpool)
+        self.log = log
+        # log position when the table was created, older records of the same name are not ours
+        self.created_lsn = 0 if log is None else log.next_lsn
+        # next base RID to hand out
+        self.num_records = 0
+        self.lock = Lock()
+        # record locks of the transactions running queries on the table
+        self.lock_manager = LockManager()
         self.index = Index(self)
-        pass
+        # base RID -> timestamp (see stamp) of the delete of a record a snapshot
+        # may still see, the record stays readable to snapshots older than it
+        self.deletes = {}
+        # (commit timestamp, order, kind, data, marker) heap of committed
+        # updates and deletes whose stale index entries and delete timestamps
+        # are kept until no snapshot older than the commit is running
+        self.garbage = []
+        self.garbage_order = count()
+        self.garbage_lock = Lock()
+        self.merge_queue = Queue()
+        self.merge_thread = None
+
+    """
+    # Returns the table's state for the catalog
+    """
+    def metadata(self):
+        return {
+            'name': self.name,
+            'num_columns': self.num_columns,
+            'key': self.key,
+            'cumulative': self.cumulative,
+            'num_records': self.num_records,
+            'created_lsn': self.created_lsn,
+            'indices': list(self.index.kinds),
+            'ranges': self.page_directory.metadata(),
+        }
+
+    """
+    # Restores the state saved by metadata()
+    """
+    def restore(self, metadata):
+        self.num_records = metadata['num_records']
+        self.created_lsn = metadata['created_lsn']
+        self.page_directory.restore(metadata['ranges'])
+
+    """
+    # Schema encodings are integer bitmaps stored in their own page column.
+    # Read most significant bit first, the top bit (snapshot_flag) marks
+    # snapshot tail records and is followed by one bit per column, set if the
+    # column is updated (column_bits).
+    """
+    def column_updated(self, schema_encoding, column):
+        return schema_encoding & self.column_bits[column] != 0
+
+    def is_snapshot(self, schema_encoding):
+        return schema_encoding & self.snapshot_flag != 0
+
+    """
+    # Returns the schema encoding marking the given columns as updated
+    """
+    def schema_encoding(self, columns):
+        schema_encoding = 0
+        for column in columns:
+            schema_encoding |= self.column_bits[column]
+        return schema_encoding
+
+    """
+    # Appends a new base record and adds it to the indices
+    # Every change is logged and applied under the page range lock, so a
+    # checkpoint can wait for logged changes to reach their pages (quiesce)
+    # Returns the RID of the record
+    """
+    def insert_record(self, columns, schema_encoding, transaction=None):
+        timestamp = None
+        try:
+            with self.lock:
+                rid = self.num_records
+                page_range = self.page_directory.range_for(rid)
+                with page_range.lock:
+                    timestamp = self.__timestamp(transaction)
+                    # a base record without updates points at itself
+                    values = [rid, rid, timestamp, schema_encoding] + list(columns)
+                    lsn = self.__log(transaction, 'insert', rid, values)
+                    page_range.append_base(values, lsn)
+                    self.index.insert_record(columns, rid)
+                self.num_records += 1
+        finally:
+            self.__publish(transaction, timestamp)
+        return rid
+
+    """
+    # Appends base records for rows (lists of user columns) with consecutive
+    # RIDs. The records are written and logged a base page at a time and the
+    # indices are built once at the end in one sorted pass. The table lock
+    # is held throughout, so a checkpoint never sees logged records missing
+    # from the indices.
+    # Returns the RID of the first record
+    """
+    def insert_records(self, rows, transaction=None):
+        directory = self.page_directory
+        timestamp = None
+        try:
+            with self.lock:
+                first_rid = rid = self.num_records
+                timestamp = self.__timestamp(transaction)
+                i = 0
+                while i < len(rows):
+                    page_range = directory.range_for(rid)
+                    count = min(len(rows) - i, PAGE_CAPACITY - rid % PAGE_CAPACITY)
+                    records = [[rid + n, rid + n, timestamp, 0] + list(rows[i + n]) for n in range(count)]
+                    with page_range.lock:
+                        lsn = self.__log(transaction, 'insert_many', rid, records)
+                        page_range.append_base_many(records, lsn)
+                    rid += count
+                    i += count
+                    self.num_records = rid
+                self.index.insert_records(rows, first_rid)
+        finally:
+            self.__publish(transaction, timestamp)
+        return first_rid
+
+    """
+    # Appends a tail record holding the non-None columns and links it in
+    # front of the base record's version chain. The first time a column is
+    # updated its original value is saved in a snapshot tail record first, so
+    # older versions survive the base pages being merged. The indices of the
+    # updated columns are moved to the new values; in a transaction the old
+    # entries stay until it commits (see Index.stale).
+    # A cumulative table also copies the latest values of the columns updated
+    # before into the tail record.
+    # Returns the RID of the tail record
+    """
+    def update_record(self, rid, columns, schema_encoding, transaction=None):
+        directory = self.page_directory
+        page_range = directory.locate(rid)[0]
+        changed = [column for column, value in enumerate(columns) if value is not None]
+        timestamp = None
+        try:
+            # a merge must never see a tail record that is not linked in yet
+            with page_range.lock:
+                indirection = previous = directory.read(rid, INDIRECTION_COLUMN)
+                base_schema = directory.read(rid, SCHEMA_ENCODING_COLUMN)
+                carried = []
+                if self.cumulative:
+                    carried = [column for column in range(self.num_columns)
+                               if columns[column] is None and self.column_updated(base_schema, column)]
+                old_columns = dict(zip(changed + carried, self.read_columns(rid, changed + carried)))
+                first_update = schema_encoding & ~base_schema
+                tail_rids = page_range.next_tail_rids(2 if first_update else 1)
+                timestamp = self.__timestamp(transaction)
+                tails = []
+                if first_update:
+                    values = [directory.read(rid, METADATA_COLUMNS + column) if first_update & bit else 0
+                              for column, bit in enumerate(self.column_bits)]
+                    tails.append([previous, tail_rids[0], timestamp, self.snapshot_flag | first_update] + values)
+                    previous = tail_rids[0]
+                values = [0 if value is None else value for value in columns]
+                tail_schema = schema_encoding
+                if carried:
+                    for column in carried:
+                        values[column] = old_columns.pop(column)
+                    tail_schema |= base_schema
+                tails.append([previous, tail_rids[-1], timestamp, tail_schema] + values)
+                data = (rid, tails, indirection, base_schema, old_columns)
+                lsn = self.__log(transaction, 'update', *data)
+                for values in tails:
+                    page_range.append_tail(values, RID_COLUMN, lsn)
+                new_rid = tail_rids[-1]
+                directory.write(rid, INDIRECTION_COLUMN, new_rid, lsn)
+                directory.write(rid, SCHEMA_ENCODING_COLUMN, base_schema | schema_encoding, lsn)
+                self.index.update_record(rid, old_columns, {column: columns[column] for column in changed}, pending=timestamp)
+                if transaction is not None:
+                    # merges stop short of tail records that may still be rolled back
+                    first_tail = tail_offset(tail_rids[0])
+                    page_range.pending_tails.add(first_tail)
+                    transaction.pending_tails.append((page_range, first_tail))
+        finally:
+            self.__publish(transaction, timestamp)
+        if transaction is None:
+            self.release('update', data, timestamp, timestamp)
+        if page_range.num_tail_records - page_range.tps >= MERGE_THRESHOLD and not page_range.merging:
+            page_range.merging = True
+            self.__schedule_merge(page_range)
+        return new_rid
+
+    """
+    # Marks a base record deleted and removes it from the indices; in a
+    # transaction its entries stay until it commits (see Index.stale), and
+    # while snapshots older than the delete run they still see the record
+    """
+    def delete_record(self, rid, transaction=None):
+        page_range = self.page_directory.locate(rid)[0]
+        timestamp = None
+        try:
+            with page_range.lock:
+                values = self.read_record(rid)
+                timestamp = self.__timestamp(transaction)
+                lsn = self.__log(transaction, 'delete', rid, values)
+                # known before the record reads as deleted, see __in_snapshot
+                self.deletes[rid] = timestamp
+                self.page_directory.write(rid, RID_COLUMN, DELETED_RID, lsn)
+                self.index.remove_record(values, rid, timestamp)
+        finally:
+            self.__publish(transaction, timestamp)
+        if transaction is None:
+            self.release('delete', (rid, values), timestamp, timestamp)
+
+    def is_deleted(self, rid):
+        return self.page_directory.read(rid, RID_COLUMN) == DELETED_RID
+
+    # versions made by a transaction are stamped with its commit timestamp
+    # at commit (see stamp), until then they carry -txn_id. A change
+    # committing on its own gets a reserved timestamp (see mvcc.reserve),
+    # published once the change is applied and its locks are released. The
+    # index entries it replaces are marked with it (see Index.stale).
+    def __timestamp(self, transaction):
+        return reserve() if transaction is None else -transaction.txn_id
+
+    def __publish(self, transaction, timestamp):
+        if transaction is None and timestamp is not None:
+            publish(timestamp)
+
+    """
+    # Writes the commit timestamp into the versions a logged change created
+    """
+    def stamp(self, kind, data, timestamp):
+        directory = self.page_directory
+        if kind == 'insert':
+            directory.write(data[0], TIMESTAMP_COLUMN, timestamp)
+        elif kind == 'insert_many':
+            for values in data[1]:
+                directory.write(values[RID_COLUMN], TIMESTAMP_COLUMN, timestamp)
+        elif kind == 'update':
+            for values in data[1]:
+                directory.write(values[RID_COLUMN], TIMESTAMP_COLUMN, timestamp)
+        elif kind == 'delete':
+            self.deletes[data[0]] = timestamp
+
+    """
+    # Drops the index entries of the old values a change committed at
+    # timestamp replaced, marked with marker, and the timestamp of a delete,
+    # as soon as every running snapshot is at least as new
+    """
+    def release(self, kind, data, marker, timestamp):
+        if kind not in ('update', 'delete'):
+            return
+        with self.garbage_lock:
+            heappush(self.garbage, (timestamp, next(self.garbage_order), kind, data, marker))
+            oldest = oldest_snapshot()
+            while self.garbage and (oldest is None or self.garbage[0][0] <= oldest):
+                timestamp, _, kind, data, marker = heappop(self.garbage)
+                rid = data[0]
+                if kind == 'update':
+                    self.index.release(rid, data[4], marker)
+                else:
+                    self.index.release(rid, dict(enumerate(data[1])), marker)
+                    if self.deletes.get(rid) == timestamp:
+                        del self.deletes[rid]
+
+    # appends a change of this table to the write-ahead log and to the
+    # transaction's changes, which is all an abort needs to roll it back
+    def __log(self, transaction, kind, *data):
+        txn_id = AUTOCOMMIT if transaction is None else transaction.txn_id
+        lsn = 0 if self.log is None else self.log.append(txn_id, kind, (self.name,) + data)
+        if transaction is not None:
+            transaction.changes.append((self, lsn, kind, data))
+        return lsn
+
+    """
+    # Reapplies a change logged at lsn (data without the table name) during
+    # recovery. Pages whose LSN shows they already hold the change are
+    # skipped and index changes are idempotent, so a change can be redone
+    # any number of times.
+    """
+    def redo(self, lsn, kind, data):
+        directory = self.page_directory
+        if kind == 'insert':
+            rid, values = data
+            with self.lock:
+                page_range = directory.range_for(rid)
+                self.num_records = max(self.num_records, rid + 1)
+            page_range.redo_append(False, rid % RECORDS_PER_RANGE, values, lsn)
+            self.index.insert_record(values[METADATA_COLUMNS:], rid, redo=True)
+        elif kind == 'insert_many':
+            rid, records = data
+            with self.lock:
+                page_range = directory.range_for(rid)
+                self.num_records = max(self.num_records, rid + len(records))
+            for values in records:
+                page_range.redo_append(False, values[RID_COLUMN] % RECORDS_PER_RANGE, values, lsn)
+                self.index.insert_record(values[METADATA_COLUMNS:], values[RID_COLUMN], redo=True)
+        elif kind == 'update':
+            rid, tails, indirection, base_schema, old_columns = data
+            page_range = directory.locate(rid)[0]
+            for values in tails:
+                page_range.redo_append(True, tail_offset(values[RID_COLUMN]), values, lsn)
+            last = tails[-1]
+            directory.write(rid, INDIRECTION_COLUMN, last[RID_COLUMN], lsn, True)
+            directory.write(rid, SCHEMA_ENCODING_COLUMN, base_schema | last[SCHEMA_ENCODING_COLUMN], lsn, True)
+            new_columns = {column: last[METADATA_COLUMNS + column] for column in old_columns}
+            self.index.update_record(rid, old_columns, new_columns, redo=True)
+        elif kind in ('delete', 'undo_insert'):
+            rid, values = data[:2]
+            directory.write(rid, RID_COLUMN, DELETED_RID, lsn, True)
+            self.index.remove_record(values, rid)
+        elif kind == 'undo_insert_many':
+            rid, rows = data[:2]
+            for n, values in enumerate(rows):
+                directory.write(rid + n, RID_COLUMN, DELETED_RID, lsn, True)
+                self.index.remove_record(values, rid + n)
+        elif kind == 'undo_update':
+            rid, tail_rids, indirection, base_schema, old_columns, new_columns = data[:6]
+            # the rolled back tail records are unlinked and never merged
+            for tail in tail_rids:
+                directory.write(tail, RID_COLUMN, DELETED_RID, lsn, True)
+            directory.write(rid, INDIRECTION_COLUMN, indirection, lsn, True)
+            directory.write(rid, SCHEMA_ENCODING_COLUMN, base_schema, lsn, True)
+            self.index.update_record(rid, new_columns, old_columns, redo=True)
+        elif kind == 'undo_delete':
+            rid, values = data[:2]
+            directory.write(rid, RID_COLUMN, rid, lsn, True)
+            self.deletes.pop(rid, None)
+            self.index.insert_record(values, rid, redo=True)
+
+    """
+    # Returns the compensation (kind, data) that rolls back a logged change,
+    # to be logged and then applied with redo()
+    """
+    def undo(self, kind, data):
+        if kind == 'insert':
+            rid, values = data
+            return 'undo_insert', (rid, values[METADATA_COLUMNS:])
+        if kind == 'insert_many':
+            rid, records = data
+            return 'undo_insert_many', (rid, [values[METADATA_COLUMNS:] for values in records])
+        if kind == 'update':
+            rid, tails, indirection, base_schema, old_columns = data
+            new_columns = {column: tails[-1][METADATA_COLUMNS + column] for column in old_columns}
+            tail_rids = [values[RID_COLUMN] for values in tails]
+            return 'undo_update', (rid, tail_rids, indirection, base_schema, old_columns, new_columns)
+        if kind == 'delete':
+            return 'undo_delete', data
+        raise ValueError("cannot undo %r" % kind)
+
+    """
+    # Rolls back a change made by transaction txn_id: the compensation from
+    # undo() is logged, pointing at undo_next as the change to roll back
+    # after this one, and then applied
+    """
+    def rollback_change(self, txn_id, kind, data, undo_next):
+        compensation, compensation_data = self.undo(kind, data)
+        compensation_data += (undo_next,)
+        page_range = self.page_directory.locate(data[0])[0]
+        with page_range.lock:
+            lsn = 0
+            if self.log is not None:
+                lsn = self.log.append(txn_id, compensation, (self.name,) + compensation_data)
+            self.redo(lsn, compensation, compensation_data)
+
+    """
+    # Holds off every change to the table for the duration of a with block:
+    # inserts wait on the table lock, the other changes on the page range
+    # locks. Reads go on.
+    """
+    @contextmanager
+    def frozen(self):
+        with self.lock:
+            ranges = list(self.page_directory.ranges)
+            for page_range in ranges:
+                page_range.lock.acquire()
+            try:
+                yield
+            finally:
+                for page_range in ranges:
+                    page_range.lock.release()
+
+    """
+    # Waits until every change logged so far by a running query has reached
+    # its pages and indices
+    """
+    def quiesce(self):
+        with self.lock:
+            ranges = list(self.page_directory.ranges)
+        for page_range in ranges:
+            with page_range.lock:
+                pass
+
+    """
+    # Returns the given user columns of a base record as they were
+    # relative_version updates ago (0 is the latest version, -1 the one before, ...)
+    # With a snapshot timestamp (see lstore.mvcc) only versions committed at
+    # or before it count; returns None if the record itself is not visible.
+    # With a bound (see tail_bound) tail records appended since it are skipped.
+    """
+    def read_columns(self, rid, columns, relative_version=0, snapshot=None, bound=None):
+        directory = self.page_directory
+        if snapshot is not None and not self.__in_snapshot(
+                rid, directory.read(rid, RID_COLUMN), directory.read(rid, TIMESTAMP_COLUMN), snapshot):
+            return None
+        return self.read_version(rid, columns, relative_version, snapshot, bound)
+
+    """
+    # Returns the given user columns of a base record at the version a
+    # relative_version, snapshot and bound pin, like read_columns, without
+    # checking that the record is visible: it was when the version was found
+    """
+    def read_version(self, rid, columns, relative_version=0, snapshot=None, bound=None):
+        page_range = self.page_directory.locate(rid)[0]
+        while True:
+            # read before any page so a concurrent merge can only make the base pages newer
+            tps = page_range.tps
+            result = self.__read_columns(rid, columns, relative_version, snapshot, bound, tps)
+            # newer base pages only serve the latest version, an older one is read again
+            if page_range.tps == tps or (relative_version == 0 and snapshot is None and bound is None):
+                return result
+
+    """
+    # Returns the number of tail records in the page range of a base record.
+    # Tail offsets only grow, so a read bounded by it (see read_columns) sees
+    # the record as it is now, however often it is updated later.
+    """
+    def tail_bound(self, rid):
+        page_range = self.page_directory.locate(rid)[0]
+        # an update appends and links its tail records under the lock
+        with page_range.lock:
+            return page_range.num_tail_records
+
+    def __read_columns(self, rid, columns, relative_version, snapshot, bound, tps):
+        directory = self.page_directory
+        column_bits = self.column_bits
+        schema_encoding = directory.read(rid, SCHEMA_ENCODING_COLUMN)
+        pending = [column for column in columns if schema_encoding & column_bits[column]]
+        values = {}
+        # original values of columns whose first update is newer than the version asked for
+        originals = {}
+        current = directory.read(rid, INDIRECTION_COLUMN)
+        # merged base pages reflect every tail record below tps, so they are only
+        # usable if none of the record's tail records skipped here is merged
+        merged = True
+        while is_tail_rid(current):
+            visible = (bound is None or tail_offset(current) < bound) and \
+                (snapshot is None or is_visible(directory.read(current, TIMESTAMP_COLUMN), snapshot))
+            if visible and relative_version >= 0:
+                break
+            merged = tail_offset(current) >= tps
+            tail_schema = directory.read(current, SCHEMA_ENCODING_COLUMN)
+            if tail_schema & self.snapshot_flag:
+                for column in pending:
+                    if tail_schema & column_bits[column]:
+                        originals[column] = directory.read(current, METADATA_COLUMNS + column)
+            elif visible:
+                relative_version += 1
+            current = directory.read(current, INDIRECTION_COLUMN)
+        while pending and is_tail_rid(current) and (not merged or tail_offset(current) >= tps):
+            tail_schema = directory.read(current, SCHEMA_ENCODING_COLUMN)
+            remaining = []
+            for column in pending:
+                if tail_schema & column_bits[column]:
+                    values[column] = directory.read(current, METADATA_COLUMNS + column)
+                else:
+                    remaining.append(column)
+            # no older tail record of a cumulative table holds a column this one lacks
+            pending = [] if self.cumulative and not tail_schema & self.snapshot_flag else remaining
+            current = directory.read(current, INDIRECTION_COLUMN)
+        result = []
+        for column in columns:
+            if column in values:
+                result.append(values[column])
+            elif column in originals:
+                result.append(originals[column])
+            else:
+                result.append(directory.read(rid, METADATA_COLUMNS + column))
+        return result
+
+    """
+    # Returns the user columns of a base record as they were relative_version updates ago
+    """
+    def read_record(self, rid, relative_version=0, snapshot=None):
+        return self.read_columns(rid, range(self.num_columns), relative_version, snapshot)
+
+    """
+    # Returns the latest values of the given user columns of each base record
+    # in rids, in order, None for records that are deleted or not visible in
+    # the snapshot (a snapshot older than a delete still sees the record). The RIDs are grouped by base page so every page is pinned
+    # once; only records whose schema encoding shows updates go to the tail pages.
+    # With a bounds dict, the values are read at the tail bound (see
+    # tail_bound) of their page range, which is put in it by RID.
+    """
+    def read_records(self, rids, columns, snapshot=None, bounds=None):
+        results = [None] * len(rids)
+        order = sorted(range(len(rids)), key=rids.__getitem__)
+        directory = self.page_directory
+        i = 0
+        while i < len(order):
+            start = i
+            page_number = rids[order[i]] // PAGE_CAPACITY
+            while i < len(order) and rids[order[i]] // PAGE_CAPACITY == page_number:
+                i += 1
+            positions = order[start:i]
+            page_range, page_index, _ = directory.locate(rids[positions[0]])
+            bound = None
+            if bounds is not None:
+                bound = self.tail_bound(rids[positions[0]])
+                for position in positions:
+                    bounds[rids[position]] = bound
+            slots = [rids[position] % PAGE_CAPACITY for position in positions]
+            base_values = []
+            for column in columns:
+                with page_range.pinned(False, METADATA_COLUMNS + column, page_index) as page:
+                    base_values.append(page.read_many(slots))
+            # read after the values: a record without updates by now has its
+            # original values in any base page
+            with page_range.pinned(False, SCHEMA_ENCODING_COLUMN, page_index) as page:
+                schemas = page.read_many(slots)
+            with page_range.pinned(False, RID_COLUMN, page_index) as page:
+                live = page.read_many(slots)
+            if snapshot is not None:
+                with page_range.pinned(False, TIMESTAMP_COLUMN, page_index) as page:
+                    timestamps = page.read_many(slots)
+            for n, position in enumerate(positions):
+                if snapshot is None:
+                    if live[n] == DELETED_RID:
+                        continue
+                elif not self.__in_snapshot(rids[position], live[n], timestamps[n], snapshot):
+                    continue
+                if schemas[n]:
+                    results[position] = self.read_columns(rids[position], columns, 0, snapshot, bound)
+                else:
+                    results[position] = [values[n] for values in base_values]
+        return results
+
+    """
+    # Returns one user column of a base record as it was relative_version updates ago
+    """
+    def read_value(self, rid, column, relative_version=0, snapshot=None):
+        values = self.read_columns(rid, (column,), relative_version, snapshot)
+        return None if values is None else values[0]
+
+    """
+    # Yields (rid, value) with the latest value of a user column for every
+    # live base record. Values are streamed a page at a time straight out of
+    # the base pages; only records whose schema encoding marks the column as
+    # updated go to the tail pages.
+    # With deleted set, deleted records are yielded too, with their last values
+    # With a snapshot, the records and values it sees are yielded instead
+    """
+    def scan(self, column, deleted=False, snapshot=None):
+        data_column = METADATA_COLUMNS + column
+        bit = self.column_bits[column]
+        for page_range in self.page_directory.ranges:
+            for page_index in range(page_range.num_pages(False)):
+                count = page_range.page_records(False, page_index)
+                first_rid = page_range.index * RECORDS_PER_RANGE + page_index * PAGE_CAPACITY
+                with page_range.pinned(False, RID_COLUMN, page_index) as page:
+                    live = page.read_range(0, count)
+                with page_range.pinned(False, SCHEMA_ENCODING_COLUMN, page_index) as page:
+                    schemas = page.read_range(0, count)
+                with page_range.pinned(False, data_column, page_index) as page:
+                    values = page.read_range(0, count)
+                if snapshot is not None:
+                    with page_range.pinned(False, TIMESTAMP_COLUMN, page_index) as page:
+                        timestamps = page.read_range(0, count)
+                for slot, (schema_encoding, value) in enumerate(zip(schemas, values)):
+                    rid = first_rid + slot
+                    if snapshot is not None:
+                        if not self.__in_snapshot(rid, live[slot], timestamps[slot], snapshot):
+                            continue
+                    elif live[slot] == DELETED_RID and not deleted:
+                        continue
+                    if schema_encoding & bit:
+                        value = self.read_value(rid, column, 0, snapshot)
+                    yield rid, value
+
+    """
+    # Returns the sum of a user column over the given base records.
+    # The RIDs are cut into runs of consecutive slots on the same page and each
+    # run is summed straight out of the page buffer; only records whose schema
+    # encoding marks the column as updated are corrected from the tail pages.
+    # With a snapshot, records it does not see are left out. With key_range
+    # (begin, end), so are records whose key was updated to outside it.
+    """
+    def sum_column(self, rids, column, relative_version=0, snapshot=None, key_range=None):
+        data_column = METADATA_COLUMNS + column
+        bit = self.column_bits[column]
+        key_bit = self.column_bits[self.key] if key_range is not None else 0
+        rids = sorted(rids)
+        total = 0
+        i = 0
+        while i < len(rids):
+            start = rids[i]
+            page_end = start - start % PAGE_CAPACITY + PAGE_CAPACITY
+            i += 1
+            while i < len(rids) and rids[i] == rids[i - 1] + 1 and rids[i] < page_end:
+                i += 1
+            page_range, page_index, slot = self.page_directory.locate(start)
+            end = slot + rids[i - 1] - start + 1
+            with page_range.pinned(False, data_column, page_index) as page:
+                values = page.read_range(slot, end)
+            with page_range.pinned(False, SCHEMA_ENCODING_COLUMN, page_index) as page:
+                schemas = page.read_range(slot, end)
+            if snapshot is not None:
+                with page_range.pinned(False, TIMESTAMP_COLUMN, page_index) as page:
+                    timestamps = page.read_range(slot, end)
+                with page_range.pinned(False, RID_COLUMN, page_index) as page:
+                    live = page.read_range(slot, end)
+            total += sum(values)
+            for offset, schema_encoding in enumerate(schemas):
+                rid = start + offset
+                if snapshot is not None and not self.__in_snapshot(rid, live[offset], timestamps[offset], snapshot):
+                    total -= values[offset]
+                elif schema_encoding & key_bit and not key_range[0] <= self.read_value(rid, self.key, 0, snapshot) <= key_range[1]:
+                    total -= values[offset]
+                elif schema_encoding & bit:
+                    total += self.read_value(rid, column, relative_version, snapshot) - values[offset]
+        return total
+
+    """
+    # Returns whether a base record is part of a snapshot, given its RID and
+    # TIMESTAMP columns: inserted at or before it and not deleted by then
+    """
+    def __in_snapshot(self, rid, live, timestamp, snapshot):
+        if not is_visible(timestamp, snapshot):
+            return False
+        if live != DELETED_RID:
+            return True
+        deleted = self.deletes.get(rid)
+        if deleted is None:
+            # deleted before any running snapshot, unless the delete was just
+            # rolled back, which puts the RID back before forgetting it
+            return self.page_directory.read(rid, RID_COLUMN) != DELETED_RID
+        return not is_visible(deleted, snapshot)
+
+    """
+    # Blocks until every scheduled merge has been applied
+    """
+    def wait_for_merges(self):
+        self.merge_queue.join()
+
+    def __schedule_merge(self, page_range):
+        if self.merge_thread is None:
+            self.merge_thread = Thread(target=self.__merge_worker, daemon=True)
+            self.merge_thread.start()
+        self.merge_queue.put(page_range)
+
+    def __merge_worker(self):
+        while True:
+            page_range = self.merge_queue.get()
+            try:
+                self.__merge(page_range)
+            finally:
+                page_range.merging = False
+                self.merge_queue.task_done()
+
+    """
+    # Consolidates the tail records of a page range into new base pages.
+    # The new pages are written to the next generation of each column's file
+    # while queries keep using the current pages, then swapped in and
+    # published by advancing the range's tps. Metadata columns are updated
+    # in place and are never merged.
+    """
+    def __merge(self, page_range):
+        directory = self.page_directory
+        bufferpool = self.bufferpool
+        with page_range.lock:
+            tps = page_range.tps
+            merge_end = min(page_range.pending_tails, default=page_range.num_tail_records)
+            num_base_records = page_range.num_base_records
+            # the merged pages hold every insert logged so far
+            lsn = 0 if self.log is None else self.log.next_lsn - 1
+        if merge_end <= tps:
+            return
+        num_pages = (num_base_records + PAGE_CAPACITY - 1) // PAGE_CAPACITY
+        columns = range(METADATA_COLUMNS, self.total_columns)
+        files = {column: page_range.merge_file(column) for column in columns}
+
+        def page_records(page_index):
+            return min(PAGE_CAPACITY, num_base_records - page_index * PAGE_CAPACITY)
 
-    def __merge(self):
-        print("merge is happening")
-        pass
- 
+        for column in columns:
+            for page_index in range(num_pages):
+                count = page_records(page_index)
+                with page_range.pinned(False, column, page_index) as page:
+                    values = page.read_range(0, count)
+                page_id = (files[column], page_index)
+                page = bufferpool.pin(page_id, 0)
+                page.write_many(values)
+                page.lsn = lsn
+                bufferpool.unpin(page_id, True)
+        first_rid = page_range.index * RECORDS_PER_RANGE
+        for rid in range(first_rid, first_rid + num_base_records):
+            schema_encoding = directory.read(rid, SCHEMA_ENCODING_COLUMN)
+            # deleted records are merged too, older snapshots may still read them
+            if not schema_encoding:
+                continue
+            pending = [column for column, bit in enumerate(self.column_bits) if schema_encoding & bit]
+            current = directory.read(rid, INDIRECTION_COLUMN)
+            page_index, slot = divmod(rid - first_rid, PAGE_CAPACITY)
+            # newest first over the tail records in [tps, merge_end)
+            while pending and is_tail_rid(current) and tail_offset(current) >= tps:
+                if tail_offset(current) < merge_end:
+                    tail_schema = directory.read(current, SCHEMA_ENCODING_COLUMN)
+                    remaining = []
+                    for column in pending:
+                        if tail_schema & self.column_bits[column]:
+                            page_id = (files[METADATA_COLUMNS + column], page_index)
+                            bufferpool.pin(page_id, page_records(page_index)).update(slot, directory.read(current, METADATA_COLUMNS + column))
+                            bufferpool.unpin(page_id, True)
+                        else:
+                            remaining.append(column)
+                    pending = [] if self.cumulative and not tail_schema & self.snapshot_flag else remaining
+                current = directory.read(current, INDIRECTION_COLUMN)
+        # nothing logs the merge itself, so its pages must be on disk before a
+        # checkpoint can refer to them; written while updates to the range go on
+        for file in files.values():
+            bufferpool.flush_file(file)
+        with page_range.lock:
+            # base records inserted during the merge have no merged tail
+            # records; their inserts are logged after lsn, which recovery
+            # redoes from while the pages they are copied to are not on disk
+            for column in columns:
+                for page_index in range(max(num_pages - 1, 0), page_range.num_pages(False)):
+                    start = page_records(page_index) if page_index < num_pages else 0
+                    end = page_range.page_records(False, page_index)
+                    if end > start:
+                        with page_range.pinned(False, column, page_index) as page:
+                            values = page.read_range(start, end)
+                            page_lsn = page.lsn
+                        page_id = (files[column], page_index)
+                        page = bufferpool.pin(page_id, start)
+                        page.write_many(values)
+                        page.lsn = max(lsn, page_lsn)
+                        bufferpool.unpin(page_id, True, lsn)
+            page_range.swap_base(columns, merge_end)
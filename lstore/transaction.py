@@ -1,5 +1,41 @@
 from lstore.table import Table, Record
 from lstore.index import Index
+from lstore import mvcc
+from itertools import count
+from threading import local
+
+# ids 1, 2, ... (0 is reserved for queries run outside a transaction)
+_txn_ids = count(1)
+# the transaction a thread is running, seen by the queries it executes
+_context = local()
+# queries that only read; a transaction made of these reads a snapshot
+READ_ONLY_QUERIES = ('select', 'select_many', 'select_version', 'scan', 'sum', 'sum_version')
+
+
+"""
+# Returns the transaction being run by the calling thread, None outside transactions
+"""
+def current_transaction():
+    return getattr(_context, 'transaction', None)
+
+
+"""
+# Returns an id no transaction has used yet, for the catalog
+"""
+def next_txn_id():
+    return next(_txn_ids)
+
+
+"""
+# Makes new transactions start at txn_id or later, so they never reuse the
+# ids of transactions found in a recovered log
+"""
+def skip_txn_ids(txn_id):
+    global _txn_ids
+    first = max(txn_id, next(_txn_ids))
+    _txn_ids = count(first)
+    mvcc.set_first_txn_id(first)
+
 
 class Transaction:
 
@@ -8,6 +44,25 @@ class Transaction:
     """
     def __init__(self):
         self.queries = []
+        self.txn_id = next(_txn_ids)
+        # write-ahead log of the tables' database, None if it is not persisted
+        self.log = None
+        # (table, lsn, kind, data) of every change made, in order, for rollback
+        self.changes = []
+        # (page range, first tail offset) of every update, kept from merges until the end
+        self.pending_tails = []
+        # lock manager -> items locked in it, held until commit or abort
+        self.locks = {}
+        # number of queries the last run executed, the failed one included
+        self.executed = 0
+        # set when the last run aborted because a lock was taken, so a retry may succeed
+        self.conflicted = False
+        # snapshot timestamp read-only runs read at, None while running writes
+        self.snapshot = None
+        # tables the queries run on
+        self.tables = []
+        # what each query the last run executed returned, in order
+        self.results = []
         pass
 
     """
@@ -19,25 +74,115 @@ class Transaction:
     """
     def add_query(self, query, table, *args):
         self.queries.append((query, args))
+        if table not in self.tables:
+            self.tables.append(table)
         # use grades_table for aborting
+        if table.log is not None:
+            self.log = table.log
 
         
+    """
+    # A transaction of only reads runs against a snapshot taken when it
+    # starts (see lstore.mvcc): it sees every transaction that committed
+    # before, nothing after, and takes no locks, so it neither blocks nor
+    # aborts writers. Other transactions lock what they touch (strict 2PL).
+    # A query that raises counts as failed: the transaction is rolled back
+    # and its locks released like on any other abort.
+    """
     # If you choose to implement this differently this method must still return True if transaction commits or False on abort
     def run(self):
-        for query, args in self.queries:
-            result = query(*args)
-            # If the query has failed the transaction should abort
-            if result == False:
-                return self.abort()
-        return self.commit()
+        _context.transaction = self
+        self.executed = 0
+        self.conflicted = False
+        self.results = []
+        self.snapshot = mvcc.begin_snapshot() if self.read_only() else None
+        try:
+            for query, args in self.queries:
+                self.executed += 1
+                try:
+                    result = query(*args)
+                except Exception:
+                    return self.abort()
+                self.results.append(result)
+                # If the query has failed the transaction should abort
+                if result == False:
+                    return self.abort()
+            return self.commit()
+        finally:
+            _context.transaction = None
+            if self.snapshot is not None:
+                mvcc.end_snapshot(self.snapshot)
+
+    """
+    # Returns whether every query of the transaction only reads
+    """
+    def read_only(self):
+        return all(query.__name__ in READ_ONLY_QUERIES for query, args in self.queries)
 
     
+    """
+    # Rolls back every change of the transaction, newest first: inserted
+    # records are deleted again, update tail records are unlinked from their
+    # version chains and deleted records come back, each with its index
+    # entries. Only what the changes logged is used, so an abort costs as
+    # much as the work it undoes.
+    """
     def abort(self):
-        #TODO: do roll-back and any other necessary operations
+        changes = self.changes
+        for i in range(len(changes) - 1, -1, -1):
+            table, lsn, kind, data = changes[i]
+            undo_next = changes[i - 1][1] if i > 0 else 0
+            table.rollback_change(self.txn_id, kind, data, undo_next)
+        if self.log is not None and self.changes:
+            self.log.abort(self.txn_id)
+        self.changes = []
+        self.__release_tails()
+        self.__release_locks()
         return False
 
     
+    """
+    # Logs the commit and waits until it is durable (see Log.commit)
+    """
     def commit(self):
-        # TODO: commit to database
+        # a transaction that changed nothing has nothing to make durable
+        if self.log is not None and self.changes:
+            self.log.commit(self.txn_id)
+        if self.changes:
+            timestamp = mvcc.commit(self.__stamp)
+            # the index entries the changes replaced go while the X locks still
+            # keep out readers of the old values, or once no snapshot needs them
+            for table, lsn, kind, data in self.changes:
+                table.release(kind, data, -self.txn_id, timestamp)
+        self.changes = []
+        self.__release_tails()
+        self.__release_locks()
+        return True
+
+    """
+    # Locks item in a table's lock manager until the transaction ends
+    # Returns False if another transaction holds a conflicting lock (no-wait)
+    """
+    def lock(self, lock_manager, item, mode):
+        if not lock_manager.acquire(self.txn_id, item, mode):
+            self.conflicted = True
+            return False
+        self.locks.setdefault(lock_manager, set()).add(item)
         return True
 
+    # makes the transaction's versions visible to snapshots from now on
+    def __stamp(self, timestamp):
+        for table, lsn, kind, data in self.changes:
+            table.stamp(kind, data, timestamp)
+
+    def __release_locks(self):
+        for lock_manager, items in self.locks.items():
+            lock_manager.release(self.txn_id, items)
+        self.locks = {}
+
+    def __release_tails(self):
+        for page_range, offset in self.pending_tails:
+            with page_range.lock:
+                page_range.pending_tails.discard(offset)
+        self.pending_tails = []
+
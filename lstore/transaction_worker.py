@@ -1,44 +1,222 @@
-from lstore.table import Table, Record
+from lstore.table import Table, Record, LazyRecord
 from lstore.index import Index
+from lstore import mvcc
+from heapq import heappop, heappush
+from multiprocessing import get_context
+from random import uniform
+from sys import maxsize
+from threading import Lock, Thread
+from time import monotonic, sleep
+
+# a transaction aborted by a lock conflict is retried up to MAX_RETRIES times, after a random
+# delay of up to BACKOFF_BASE * 2 ** (retry - 1) seconds, capped at BACKOFF_CAP
+MAX_RETRIES = 32
+BACKOFF_BASE = 0.001
+BACKOFF_CAP = 0.1
+
+# transactions of each process of the pool, set in the forked children
+_partitions = []
+# pools are forked one at a time, see TransactionWorker.__fork
+_fork_lock = Lock()
+
+
+"""
+# Runs first in every forked child. The child inherited the locks its
+# parent held while forking, and gets the partitions of its own pool as
+# arguments, never from module state another worker may be changing.
+"""
+def _start_child(partitions, locks, bufferpools):
+    global _partitions
+    _partitions = partitions
+    for lock in reversed(locks):
+        lock.release()
+    # a child only reads: it keeps every page it loads rather than write
+    # back pages the parent owns
+    for bufferpool in bufferpools:
+        bufferpool.capacity = maxsize
+
+
+"""
+# Runs a partition's transactions in a child and returns, for each, whether
+# it committed and the results of its queries, for the parent to hand out
+"""
+def _run_partition(partition):
+    outcomes = []
+    for transaction in _partitions[partition]:
+        committed = transaction.run()
+        outcomes.append((committed, _detach(transaction.results)))
+    return outcomes
+
+
+# reads the columns of lazy records before they leave the child, which has
+# the only copy of the table they would read from
+def _detach(result):
+    if isinstance(result, LazyRecord):
+        return Record(result.rid, result.key, result.columns)
+    if isinstance(result, list):
+        return [_detach(item) for item in result]
+    return result
+
+
+"""
+# Returns how long to wait before the given retry (1, 2, ...) of an aborted
+# transaction: exponential backoff with full jitter, so transactions that
+# conflicted once do not collide again in lockstep
+"""
+def backoff(retry):
+    return uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (retry - 1)))
+
 
 class TransactionWorker:
 
     """
     # Creates a transaction worker object.
+    # By default the worker runs its transactions on a thread, re-queueing
+    # aborted ones (see backoff) while other transactions go ahead. With
+    # processes set, read-only transactions are instead partitioned by key
+    # range over a pool of forked processes, so CPU-bound queries run
+    # outside the GIL. They read the database as it was when the pool was
+    # forked, and their query results come back in each transaction's
+    # results. Transactions that write run on the worker's thread meanwhile,
+    # under the locks and log of the database they change.
+    :param transactions: list   #Transactions to run
+    :param processes: int       #Size of the process pool, 0 to run on a thread
     """
-    def __init__(self, transactions = []):
+    def __init__(self, transactions = [], processes = 0):
+        # whether each transaction finally committed, in the order they were added
         self.stats = []
-        self.transactions = transactions
+        # retries of each transaction, and queries run by attempts that aborted
+        self.retries = []
+        self.wasted_queries = 0
+        # copied, so workers never share the default list
+        self.transactions = list(transactions)
         self.result = 0
+        self.processes = processes
+        self.thread = None
         pass
 
-    
+
     """
     Appends t to transactions
     """
     def add_transaction(self, t):
         self.transactions.append(t)
 
-        
+
     """
     Runs all transaction as a thread
     """
     def run(self):
-        pass
-        # here you need to create a thread and call __run
-    
+        self.thread = Thread(target=self.__run_processes if self.processes else self.__run_all)
+        self.thread.start()
+
 
     """
     Waits for the worker to finish
     """
     def join(self):
-        pass
+        if self.thread is not None:
+            self.thread.join()
 
 
-    def __run(self):
-        for transaction in self.transactions:
-            # each transaction returns True if committed or False if aborted
-            self.stats.append(transaction.run())
+    def __run_all(self):
+        self.stats = [False] * len(self.transactions)
+        self.retries = [0] * len(self.transactions)
+        self.__run(range(len(self.transactions)))
         # stores the number of transactions that committed
         self.result = len(list(filter(lambda x: x, self.stats)))
 
+    # runs the transactions at the given positions, retrying aborted ones
+    def __run(self, positions):
+        positions = list(positions)
+        # (time the retry is due, position) of aborted transactions
+        waiting = []
+        position = 0
+        while position < len(positions) or waiting:
+            if waiting and (position == len(positions) or waiting[0][0] <= monotonic()):
+                due, i = heappop(waiting)
+                delay = due - monotonic()
+                if delay > 0:
+                    sleep(delay)
+            else:
+                i = positions[position]
+                position += 1
+            transaction = self.transactions[i]
+            # each transaction returns True if committed or False if aborted
+            self.stats[i] = transaction.run()
+            if not self.stats[i]:
+                self.wasted_queries += transaction.executed
+                if transaction.conflicted and self.retries[i] < MAX_RETRIES:
+                    self.retries[i] += 1
+                    heappush(waiting, (monotonic() + backoff(self.retries[i]), i))
+
+    """
+    # Sorts the read-only transactions by the key their first query starts
+    # at and hands each process a contiguous key range of them, then runs
+    # the transactions that write while the processes work
+    """
+    def __run_processes(self):
+        self.stats = [False] * len(self.transactions)
+        self.retries = [0] * len(self.transactions)
+        reads = [i for i, transaction in enumerate(self.transactions) if transaction.read_only()]
+        writes = [i for i, transaction in enumerate(self.transactions) if not transaction.read_only()]
+        if reads:
+            order = sorted(reads, key=lambda i: self.__first_key(self.transactions[i]))
+            size = -(-len(order) // self.processes)
+            chunks = [order[start:start + size] for start in range(0, len(order), size)]
+            partitions = [[self.transactions[i] for i in chunk] for chunk in chunks]
+            with self.__fork(partitions) as pool:
+                pending = pool.map_async(_run_partition, range(len(chunks)))
+                self.__run(writes)
+                outcomes = pending.get()
+            for chunk, chunk_outcomes in zip(chunks, outcomes):
+                for i, (committed, results) in zip(chunk, chunk_outcomes):
+                    self.stats[i] = committed
+                    self.transactions[i].results = results
+        else:
+            self.__run(writes)
+        self.result = len(list(filter(lambda x: x, self.stats)))
+
+    """
+    # Forks a pool of processes for the given partitions. Other threads keep
+    # running queries, so the locks of the tables the transactions use are
+    # held while forking: no child starts out with one taken by a thread it
+    # does not have.
+    """
+    def __fork(self, partitions):
+        tables = []
+        for partition in partitions:
+            for transaction in partition:
+                tables.extend(table for table in transaction.tables if table not in tables)
+        bufferpools = []
+        for table in tables:
+            if table.bufferpool not in bufferpools:
+                bufferpools.append(table.bufferpool)
+        logs = []
+        for table in tables:
+            if table.log is not None and table.log not in logs:
+                logs.append(table.log)
+        with _fork_lock:
+            locks = []
+            try:
+                # in the order queries take them; with a table's lock held no
+                # page range is added to it
+                for table in tables:
+                    for lock in [table.lock] + [page_range.lock for page_range in table.page_directory.ranges]:
+                        lock.acquire()
+                        locks.append(lock)
+                for lock in [mvcc._lock] + [table.index.lock for table in tables] \
+                        + [bufferpool.lock for bufferpool in bufferpools] + [log.cond for log in logs]:
+                    lock.acquire()
+                    locks.append(lock)
+                return get_context('fork').Pool(len(partitions), _start_child, (partitions, locks, bufferpools))
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+
+    @staticmethod
+    def __first_key(transaction):
+        if not transaction.queries:
+            return 0
+        args = transaction.queries[0][1]
+        return args[0] if args else 0
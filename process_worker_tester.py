@@ -0,0 +1,93 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+from lstore.transaction_worker import TransactionWorker
+
+from random import randint, seed
+from threading import Thread
+from time import monotonic
+
+db = Database()
+
+# creating grades table
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+grades_table.index.create_index(2)
+
+number_of_records = 5000
+number_of_workers = 4
+seed(3562901)
+
+records = {}
+for key in range(number_of_records):
+    records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+    query.insert(*records[key])
+# other threads update the first half of the records, the workers read the second
+half = number_of_records // 2
+number_of_writes = 10
+
+# each process-mode worker runs read-only transactions in its processes; the
+# sums of the odd workers cover keys that do not exist, so all their reads
+# abort, and a worker that got another worker's transactions shows in its
+# stats. The transactions that write run in the worker itself.
+workers = []
+for w in range(number_of_workers):
+    worker = TransactionWorker([], processes=2)
+    for i in range(20 + 10 * w):
+        transaction = Transaction()
+        key = randint(half, number_of_records - 100)
+        if w % 2:
+            transaction.add_query(query.sum, grades_table, number_of_records + key, number_of_records + key + 9, 1)
+        else:
+            transaction.add_query(query.sum, grades_table, key, key + 9, 1)
+        transaction.add_query(query.select, grades_table, key, 0, [1, 1, 1, 1, 1], True)
+        worker.add_transaction(transaction)
+    for i in range(number_of_writes):
+        transaction = Transaction()
+        key = number_of_records - 1 - number_of_writes * w - i
+        transaction.add_query(query.update, grades_table, key, None, None, None, None, 100 + w)
+        worker.add_transaction(transaction)
+    workers.append(worker)
+
+# threads keep updating records while the workers fork their processes
+stop = False
+def update():
+    while not stop:
+        query.update(randint(0, half - 1), None, randint(0, 20), randint(0, 20), None, None)
+        query.select(randint(0, 20), 2, [1, 1, 1, 1, 1])
+updaters = [Thread(target=update) for _ in range(2)]
+for updater in updaters:
+    updater.start()
+
+start = monotonic()
+for worker in workers:
+    worker.run()
+for worker in workers:
+    worker.join()
+stop = True
+for updater in updaters:
+    updater.join()
+
+for w, worker in enumerate(workers):
+    if len(worker.stats) != len(worker.transactions):
+        print('process worker error: worker', w, 'has', len(worker.stats), 'results for', len(worker.transactions), 'transactions')
+    elif worker.result != (number_of_writes if w % 2 else len(worker.transactions)):
+        print('process worker error: worker', w, 'committed', worker.result, 'of', len(worker.transactions))
+    # the reads' results came back from the processes
+    for transaction, committed in zip(worker.transactions, worker.stats):
+        if not committed or not transaction.read_only():
+            continue
+        key = transaction.queries[0][1][0]
+        total, selected = transaction.results
+        if total != sum(records[k][1] for k in range(key, key + 10)) or [r.columns for r in selected] != [records[key]]:
+            print('process worker error: worker', w, 'read wrong results for', key)
+    # and the writes reached the database
+    for i in range(number_of_writes):
+        key = number_of_records - 1 - number_of_writes * w - i
+        if query.select(key, 0, [1, 1, 1, 1, 1])[0].columns[4] != 100 + w:
+            print('process worker error: worker', w, 'did not write', key)
+if monotonic() - start > 60:
+    print('process worker error: workers took', monotonic() - start, 'seconds')
+print("Process workers finished")
+
+db.close()
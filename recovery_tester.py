@@ -0,0 +1,114 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+from random import choice, randint, sample, seed
+import os
+import shutil
+
+path = './RECOVERY'
+shutil.rmtree(path, ignore_errors=True)
+
+number_of_records = 2000
+number_of_transactions = 300
+seed(3562901)
+
+# the changes the child commits before it dies, planned here so the parent
+# knows what the database must hold after recovery
+keys = list(range(number_of_records))
+records = {key: [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)] for key in keys}
+committed = {key: list(columns) for key, columns in records.items()}
+plan = []
+for i in range(number_of_transactions):
+    changes = []
+    for key in sample(keys, 5):
+        columns = [None, randint(0, 20), None, randint(0, 20), None]
+        changes.append((key, columns))
+        committed[key] = [old if new is None else new for old, new in zip(committed[key], columns)]
+    plan.append(changes)
+deleted = sample(keys, 50)
+for key in deleted:
+    del committed[key]
+inserted = {number_of_records + i: [number_of_records + i, 1, 2, 3, 4] for i in range(50)}
+committed.update(inserted)
+# changes of the transaction running when the child dies, none may survive
+losers = sample(sorted(committed), 20)
+
+pid = os.fork()
+if pid == 0:
+    db = Database()
+    db.open(path)
+    grades_table = db.create_table('Grades', 5, 0)
+    query = Query(grades_table)
+    grades_table.index.create_index(2)
+    for key in keys:
+        query.insert(*records[key])
+    db.checkpoint()
+    for i, changes in enumerate(plan):
+        transaction = Transaction()
+        for key, columns in changes:
+            transaction.add_query(query.update, grades_table, key, *columns)
+        transaction.run()
+        if i == number_of_transactions // 2:
+            # a checkpoint in the middle, recovery starts from it
+            db.checkpoint()
+    transaction = Transaction()
+    for key in deleted:
+        transaction.add_query(query.delete, grades_table, key)
+    for columns in inserted.values():
+        transaction.add_query(query.insert, grades_table, *columns)
+    transaction.run()
+
+    def crash():
+        # the loser's changes reach the log on disk, recovery must undo them
+        db.log.flush()
+        os._exit(0)
+    loser = Transaction()
+    for key in losers:
+        loser.add_query(query.update, grades_table, key, None, -1, -1, -1, -1)
+    loser.add_query(query.delete, grades_table, losers[0])
+    loser.add_query(query.insert, grades_table, -1, -1, -1, -1, -1)
+    loser.add_query(crash, grades_table)
+    loser.run()
+    os._exit(1)
+os.waitpid(pid, 0)
+
+# reopen the database the child left behind without closing it
+db = Database()
+db.open(path)
+grades_table = db.get_table('Grades')
+query = Query(grades_table)
+for key in keys + list(inserted) + [-1]:
+    result = query.select(key, 0, [1, 1, 1, 1, 1])
+    columns = result[0].columns if result else None
+    if columns != committed.get(key):
+        print('recovery error on', key, ':', columns, ', correct:', committed.get(key))
+for value in range(21):
+    result = sorted(record.key for record in query.select(value, 2, [1, 1, 1, 1, 1]))
+    if result != sorted(key for key, columns in committed.items() if columns[2] == value):
+        print('recovery error on index of column 2, value', value)
+if query.sum(0, 3 * number_of_records, 1) != sum(columns[1] for columns in committed.values()):
+    print('recovery error on sum')
+print("Recovery finished")
+
+# the recovered database takes new transactions and survives a clean reopen
+key = choice(sorted(committed))
+transaction = Transaction()
+transaction.add_query(query.update, grades_table, key, None, 99, None, None, None)
+if not transaction.run():
+    print('recovery error: update after recovery aborted')
+committed[key][1] = 99
+# values that do not fit the int64 pages are rejected before they are logged
+if query.update(key, None, 'x', None, None, None) or query.insert(-2, 2 ** 70, 0, 0, 0) \
+        or query.insert_many([[-3, 0, 0, 0, 0], [-4, 0, 0.5, 0, 0]]):
+    print('recovery error: value that does not fit a page accepted')
+db.close()
+db = Database()
+db.open(path)
+grades_table = db.get_table('Grades')
+query = Query(grades_table)
+if query.sum(0, 3 * number_of_records, 1) != sum(columns[1] for columns in committed.values()):
+    print('recovery error after reopen')
+db.close()
+shutil.rmtree(path, ignore_errors=True)
+print("Reopen finished")
@@ -0,0 +1,83 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+from random import randint, sample, seed
+
+db = Database()
+
+# creating grades table
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+grades_table.index.create_index(2)
+
+number_of_records = 1000
+number_of_transactions = 200
+seed(3562901)
+
+records = {}
+for key in range(number_of_records):
+    records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+    query.insert(*records[key])
+# every record has an older version, so the versions a rollback must keep can be checked
+for key in range(number_of_records):
+    columns = [None, randint(0, 20), None, None, randint(0, 20)]
+    query.update(key, *columns)
+    records[key] = [old if new is None else new for old, new in zip(records[key], columns)]
+previous = {key: query.select_version(key, 0, [1, 1, 1, 1, 1], -1)[0].columns for key in records}
+
+
+def fail():
+    return False
+
+
+def check(what):
+    for key in list(range(number_of_records + 100)) + [-1, -1001]:
+        result = query.select(key, 0, [1, 1, 1, 1, 1])
+        columns = result[0].columns if result else None
+        if columns != records.get(key):
+            print('rollback error after', what, 'on', key, ':', columns, ', correct:', records.get(key))
+    for key in previous:
+        if query.select_version(key, 0, [1, 1, 1, 1, 1], -1)[0].columns != previous[key]:
+            print('rollback error after', what, 'on the previous version of', key)
+    for value in range(21):
+        result = sorted(record.key for record in query.select(value, 2, [1, 1, 1, 1, 1]))
+        if result != sorted(key for key, columns in records.items() if columns[2] == value):
+            print('rollback error after', what, 'on index of column 2, value', value)
+    if query.sum(0, number_of_records + 100, 3) != sum(columns[3] for columns in records.values()):
+        print('rollback error after', what, 'on sum')
+
+
+# aborted transactions mixing every kind of change leave nothing behind
+for i in range(number_of_transactions):
+    transaction = Transaction()
+    for key in sample(sorted(records), 3):
+        transaction.add_query(query.update, grades_table, key, None, randint(0, 20), randint(0, 20), None, None)
+    key = sample(sorted(records), 1)[0]
+    # a key change followed by a change back and another update
+    transaction.add_query(query.update, grades_table, key, number_of_records + i, None, None, None, None)
+    transaction.add_query(query.update, grades_table, number_of_records + i, key, None, None, None, None)
+    transaction.add_query(query.update, grades_table, key, None, None, randint(0, 20), None, None)
+    transaction.add_query(query.delete, grades_table, sample(sorted(records), 1)[0])
+    transaction.add_query(query.insert, grades_table, number_of_records + 50 + i % 50, 1, 2, 3, 4)
+    transaction.add_query(query.insert_many, grades_table, [[-1 - i, 1, 2, 3, 4], [-1001 - i, 1, 2, 3, 4]])
+    transaction.add_query(fail, grades_table)
+    if transaction.run():
+        print('rollback error: transaction with a failing query committed')
+check('aborts')
+print("Rollback finished")
+
+# a rolled back record is locked no more, and its changes can be made again
+transaction = Transaction()
+key = sample(sorted(records), 1)[0]
+transaction.add_query(query.delete, grades_table, key)
+transaction.add_query(query.insert, grades_table, number_of_records + 1, 5, 5, 5, 5)
+if not transaction.run():
+    print('rollback error: transaction after aborts did not commit')
+del records[key]
+previous.pop(key)
+records[number_of_records + 1] = [number_of_records + 1, 5, 5, 5, 5]
+check('a commit')
+print("Commit after rollback finished")
+
+db.close()
@@ -0,0 +1,118 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+from threading import Event, Thread
+
+db = Database()
+
+# creating grades table
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+grades_table.index.create_index(2)
+
+number_of_records = 1000
+records = {}
+for key in range(number_of_records):
+    records[key] = [key, key % 10, key % 100, key * 2, 0]
+    query.insert(*records[key])
+
+
+def expected(column, begin, end):
+    return sorted(record for record in records.values() if begin <= record[column] <= end)
+
+
+"""
+# Runs transaction on a thread until it reaches a query waiting for the
+# returned event, so other transactions can run while it holds its locks
+"""
+def run_paused(transaction):
+    reached, resume = Event(), Event()
+    def pause():
+        reached.set()
+        resume.wait()
+        return True
+    transaction.add_query(pause, grades_table)
+    results = []
+    thread = Thread(target=lambda: results.append(transaction.run()))
+    thread.start()
+    reached.wait()
+    return resume, thread, results
+
+
+# outside a transaction a scan streams its records
+scanned = sorted(record.columns for record in query.scan(2, 10, 19, [1, 1, 1, 1, 1]))
+if scanned != expected(2, 10, 19):
+    print('scan error outside a transaction')
+scanned = sorted(record.columns for record in query.scan(3, 100, 199, [1, 1, 1, 1, 1]))
+if scanned != expected(3, 100, 199):
+    print('scan error on a column without index')
+
+# in a transaction the records are read before the query returns, and the
+# transaction holds their shared locks until it ends
+found = []
+# named after the query it runs, so a transaction of it alone is read-only
+def scan(*args):
+    result = query.scan(*args)
+    found.append(result)
+    return result
+
+scanner = Transaction()
+scanner.add_query(scan, grades_table, 2, 20, 29, [1, 1, 1, 1, 1])
+scanner.add_query(query.update, grades_table, 999, None, None, None, None, 1)
+resume, thread, results = run_paused(scanner)
+if not isinstance(found[0], list) or sorted(record.columns for record in found[0]) != expected(2, 20, 29):
+    print('scan error in a transaction:', found[0])
+writer = Transaction()
+writer.add_query(query.update, grades_table, 25, None, None, None, None, 1)
+if writer.run():
+    print('scan error: a record scanned by a running transaction was updated')
+resume.set()
+thread.join()
+if results != [True]:
+    print('scan error: scanning transaction did not commit')
+if not writer.run():
+    print('scan error: locks of the scan outlived its transaction')
+records[25][4] = 1
+records[999][4] = 1
+
+# a scan meeting a record locked by another transaction aborts its transaction
+updater = Transaction()
+updater.add_query(query.update, grades_table, 35, None, None, None, None, 2)
+resume, thread, results = run_paused(updater)
+scanner = Transaction()
+scanner.add_query(query.scan, grades_table, 2, 30, 39, [1, 1, 1, 1, 1])
+scanner.add_query(query.update, grades_table, 998, None, None, None, None, 2)
+if scanner.run():
+    print('scan error: scan over a locked record committed')
+resume.set()
+thread.join()
+records[35][4] = 2
+if query.select(998, 0, [1, 1, 1, 1, 1])[0].columns != records[998]:
+    print('scan error: aborted transaction left its update behind')
+
+# a read-only transaction scans its snapshot, also once the transaction ended
+found = []
+reader = Transaction()
+reader.add_query(scan, grades_table, 4, 0, 2, [1, 1, 1, 1, 1])
+reader.add_query(query.select, grades_table, 0, 0, [1, 1, 1, 1, 1])
+reader.run()
+if sorted(record.columns for record in found[0]) != expected(4, 0, 2):
+    print('scan error in a read-only transaction')
+print("Scan finished")
+
+# lazy records read the version their query found, however the record changes later
+lazy = list(query.scan(2, 50, 52, [1, 1, 1, 1, 1], True))
+older = query.select_version(50, 0, [1, 1, 1, 1, 1], -1, True)[0]
+if older[3] != 100:
+    print('lazy error: wrong older version')
+for value in range(3):
+    query.update(50, None, None, None, 1000 + value, 7)
+    query.update(51, None, None, 1000 + value, None, 7)
+if sorted(record.columns for record in lazy) != expected(2, 50, 52):
+    print('lazy error: scanned records mix in later updates')
+if older.columns != [50, 0, 50, 100, 0]:
+    print('lazy error: older version moved on:', older.columns)
+print("Lazy finished")
+
+db.close()
@@ -0,0 +1,75 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+from random import randint, sample, seed, shuffle
+
+db = Database()
+
+# creating grades table
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+grades_table.index.create_index(2)
+
+number_of_records = 5000
+seed(3562901)
+records = {}
+for key in range(number_of_records):
+    records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+    query.insert(*records[key])
+# enough updates for merges to run, and some deletes
+for i in range(3000):
+    key = randint(0, number_of_records - 1)
+    if key in records:
+        columns = [None, randint(0, 20), None, randint(0, 20), None]
+        query.update(key, *columns)
+        records[key] = [old if new is None else new for old, new in zip(records[key], columns)]
+for key in sample(range(number_of_records), 100):
+    query.delete(key)
+    records.pop(key, None)
+
+
+"""
+# Looks up keys on a column with select_many and checks that every key's
+# records come back at its position, an empty list for keys without records
+"""
+def check(name, keys, column, projected):
+    found = query.select_many(keys, column, projected)
+    if found is False or len(found) != len(keys):
+        print('select_many error:', name, 'returned', found if found is False else len(found), 'results for', len(keys), 'keys')
+        return
+    for key, result in zip(keys, found):
+        expected = sorted([value if wanted else None for value, wanted in zip(columns, projected)]
+                          for columns in records.values() if columns[column] == key)
+        if sorted(record.columns for record in result) != expected:
+            print('select_many error:', name, 'key', key, ':', [record.columns for record in result], ', correct:', expected)
+
+
+# keys out of order, some of them deleted or never inserted, one repeated
+keys = sample(range(-100, number_of_records + 100), 1000)
+keys += keys[:10]
+shuffle(keys)
+check('primary key', keys, 0, [1, 1, 1, 1, 1])
+check('projection', keys, 0, [1, 0, 1, 0, 0])
+check('indexed column', [20, 3, 50, 3, 0, -1], 2, [1, 1, 1, 1, 1])
+check('column without index', [4, 30, 17, 4], 3, [1, 1, 1, 1, 1])
+check('no keys', [], 0, [1, 1, 1, 1, 1])
+
+# in a read-only transaction select_many reads its snapshot
+found = []
+# named after the query it runs, so the transaction stays read-only
+def select_many(*args):
+    result = query.select_many(*args)
+    found.append(result)
+    return result
+
+reader = Transaction()
+reader.add_query(select_many, grades_table, keys[:100], 0, [1, 1, 1, 1, 1])
+if not reader.run():
+    print('select_many error: read-only transaction aborted')
+expected = [[records[key]] if key in records else [] for key in keys[:100]]
+if [[record.columns for record in result] for result in found[0]] != expected:
+    print('select_many error in a read-only transaction')
+print("Select many finished")
+
+db.close()
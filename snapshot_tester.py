@@ -0,0 +1,142 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+from threading import Event, Thread
+
+db = Database()
+
+# creating grades table
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+grades_table.index.create_index(2)
+
+number_of_records = 100
+records = {}
+for key in range(number_of_records):
+    records[key] = [key, key, key % 10, key, key]
+    query.insert(*records[key])
+
+everything = [1, 1, 1, 1, 1]
+
+
+"""
+# Runs a read-only transaction of reads on a thread, stops it after them and
+# lets it read the same again once the returned event is set. Returns what
+# the reads found before and after the stop, once the transaction ended
+"""
+def run_reader(reads):
+    reached, resume = Event(), Event()
+    # named after the query it runs, so the transaction stays read-only
+    def select(*args):
+        reached.set()
+        resume.wait()
+        return query.select(*args)
+    reader = Transaction()
+    for query_function, *args in reads:
+        reader.add_query(query_function, grades_table, *args)
+    reader.add_query(select, grades_table, 0, 0, everything)
+    for query_function, *args in reads:
+        reader.add_query(query_function, grades_table, *args)
+    committed = []
+    thread = Thread(target=lambda: committed.append(reader.run()))
+    thread.start()
+    reached.wait()
+    def finish():
+        resume.set()
+        thread.join()
+        if committed != [True]:
+            print('snapshot error: reader did not commit')
+        return [columns(result) for result in reader.results[:len(reads)]], \
+               [columns(result) for result in reader.results[len(reads) + 1:]]
+    return finish
+
+
+# the columns of the records a query returned, select_many's per key
+def columns(result):
+    if not isinstance(result, list):
+        return result
+    return [columns(item) for item in result] if result and isinstance(result[0], list) \
+        else sorted(record.columns for record in result)
+
+
+def commit(*queries):
+    transaction = Transaction()
+    for query_function, *args in queries:
+        transaction.add_query(query_function, grades_table, *args)
+    if not transaction.run():
+        print('snapshot error: writer aborted')
+
+
+# a reader re-reads what it read first however many commits happen meanwhile
+reads = [(query.select, 1, 0, everything),
+         (query.select, 2, 0, everything),
+         (query.select, 3, 2, everything),
+         (query.select_many, [4, 5, 6], 0, everything),
+         (query.sum, 0, number_of_records - 1, 1),
+         (query.scan, 1, 0, 9, everything)]
+deleted_rids = [grades_table.index.locate(0, key)[0] for key in (5, 6)]
+finish = run_reader(reads)
+for value in range(5):
+    commit((query.update, 1, None, 100 + value, None, None, None),
+           (query.update, 4, None, None, None, 100 + value, None))
+    # changes outside transactions commit on their own
+    query.update(2, None, 100 + value, None, None, None)
+# the record leaves the indexed value the reader looked up
+commit((query.update, 3, None, None, 7, None, None))
+# records the reader found are deleted, one in a transaction, one on its own
+commit((query.delete, 5))
+query.delete(6)
+if not all(rid in grades_table.deletes for rid in deleted_rids):
+    print('snapshot error: delete released while a snapshot may read the record')
+first, second = finish()
+if first != second:
+    print('snapshot error: re-read differs from first read:', first, second)
+expected = [[records[1]], [records[2]], sorted(records[key] for key in records if records[key][2] == 3),
+            [[records[4]], [records[5]], [records[6]]], sum(records[key][1] for key in records),
+            sorted(records[key] for key in records if records[key][1] <= 9)]
+if first != expected:
+    print('snapshot error: reader missed the records as they were when it started:', first)
+
+# new readers see every commit
+records[1][1] = 104
+records[2][1] = 104
+records[4][3] = 104
+records[3][2] = 7
+del records[5], records[6]
+for key in (1, 2, 3, 4, 5, 6):
+    result = query.select(key, 0, everything)
+    if (result[0].columns if result else None) != records.get(key):
+        print('snapshot error: latest version of', key, 'is', result)
+if query.sum(0, number_of_records - 1, 1) != sum(columns[1] for columns in records.values()):
+    print('snapshot error: latest sum')
+print("Snapshot finished")
+
+# a snapshot keeps what it may still read: the delete timestamps and stale
+# index entries of the changes committed after it
+rid = grades_table.index.locate(0, 10)[0]
+finish = run_reader([(query.select, 10, 0, everything), (query.select, 10, 2, everything)])
+commit((query.delete, 10))
+if rid not in grades_table.deletes:
+    print('release error: delete dropped while a snapshot may read the record')
+if (2, 0, rid) not in grades_table.index.stale or rid not in grades_table.index.locate(2, 0, True):
+    print('release error: index entry dropped while a snapshot may read it')
+if not grades_table.garbage:
+    print('release error: nothing kept for the running snapshot')
+first, second = finish()
+if first != second or first[0] != [[10, 10, 0, 10, 10]]:
+    print('release error: snapshot lost the deleted record:', first, second)
+del records[10]
+# with no snapshot running, the next commit releases what the older ones kept
+commit((query.update, 11, None, 1, None, None, None))
+records[11][1] = 1
+if grades_table.garbage or grades_table.deletes or grades_table.index.stale:
+    print('release error: kept changes not released:', len(grades_table.garbage),
+          len(grades_table.deletes), len(grades_table.index.stale))
+if rid in grades_table.index.locate(2, 0, True) or query.select(10, 0, everything):
+    print('release error: deleted record still found')
+if sorted(record.key for record in query.select(0, 2, everything)) != sorted(key for key in records if records[key][2] == 0):
+    print('release error: index of column 2 after release')
+print("Release finished")
+
+db.close()
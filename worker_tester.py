@@ -0,0 +1,81 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+from lstore.transaction_worker import TransactionWorker
+
+from random import randint, seed
+import shutil
+
+path = './WORKERS'
+shutil.rmtree(path, ignore_errors=True)
+
+db = Database()
+db.open(path)
+
+# creating grades table
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+
+number_of_records = 20
+number_of_transactions = 800
+num_threads = 8
+seed(3562901)
+
+for key in range(number_of_records):
+    query.insert(key, 0, 0, 0, 0)
+
+# few records and many threads: transactions keep conflicting, and the
+# workers retry them until they get through
+transactions = []
+for i in range(number_of_transactions):
+    transaction = Transaction()
+    first = randint(0, number_of_records - 1)
+    second = (first + randint(1, number_of_records - 1)) % number_of_records
+    transaction.add_query(query.increment, grades_table, first, 1)
+    transaction.add_query(query.increment, grades_table, second, 1)
+    transactions.append((transaction, first, second))
+
+transaction_workers = []
+for i in range(num_threads):
+    transaction_workers.append(TransactionWorker())
+for i, (transaction, first, second) in enumerate(transactions):
+    transaction_workers[i % num_threads].add_transaction(transaction)
+for worker in transaction_workers:
+    worker.run()
+for worker in transaction_workers:
+    worker.join()
+
+# every committed transaction incremented both its records, no other did
+expected = [0] * number_of_records
+committed = 0
+for i, (transaction, first, second) in enumerate(transactions):
+    worker = transaction_workers[i % num_threads]
+    if worker.stats[i // num_threads]:
+        committed += 1
+        expected[first] += 1
+        expected[second] += 1
+if committed != sum(worker.result for worker in transaction_workers):
+    print('worker error: results do not add up to the committed transactions')
+if committed < number_of_transactions * 0.9:
+    print('worker error: only', committed, 'of', number_of_transactions, 'transactions committed')
+if not any(sum(worker.retries) for worker in transaction_workers):
+    print('worker error: no transaction was retried')
+for key in range(number_of_records):
+    column = query.select(key, 0, [1, 1, 1, 1, 1])[0].columns[1]
+    if column != expected[key]:
+        print('worker error on', key, ':', column, ', correct:', expected[key])
+print("Workers finished")
+
+# the committed transactions are durable
+db.close()
+db = Database()
+db.open(path)
+grades_table = db.get_table('Grades')
+query = Query(grades_table)
+for key in range(number_of_records):
+    column = query.select(key, 0, [1, 1, 1, 1, 1])[0].columns[1]
+    if column != expected[key]:
+        print('worker error after reopen on', key, ':', column, ', correct:', expected[key])
+db.close()
+shutil.rmtree(path, ignore_errors=True)
+print("Reopen finished")